@@ -37,9 +37,9 @@ def clear_cache():
                 shutil.rmtree(full_path)
 
     # Actualizar versión
-    from version_manager import VersionManager
+    from version_manager import get_manager
 
-    vm = VersionManager()
+    vm = get_manager()
     vm.bump_build()
     print(f"Nueva versión: {vm.get_version_string()}")
 
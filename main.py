@@ -5,11 +5,13 @@ Sistema modular para gestión de productos y descripciones
 
 import sys
 import os
+import atexit
 import webbrowser
 import threading
 import time
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Agregar módulos al path
 sys.path.append(str(Path(__file__).parent))
@@ -26,7 +28,7 @@ from products.product_filters import FilterCriteria
 from navigation.selenium_handler import SeleniumHandler
 from ai_generator.ai_handler import AIHandler
 from ai_generator.prompt_manager import PromptManager
-from version_manager import VersionManager
+from version_manager import get_manager
 
 # Configuración de logging
 logging.basicConfig(
@@ -42,10 +44,11 @@ app = Flask(__name__, static_folder="static", template_folder="templates")
 CORS(app)
 
 # Crear instancia del gestor de versiones
-version_manager = VersionManager()
+version_manager = get_manager()
 
 # Instancias globales de los módulos
 product_manager = ProductManager()
+atexit.register(product_manager.db_handler.dispose)
 selenium_handler = SeleniumHandler()
 ai_handler = AIHandler()
 prompt_manager = PromptManager()
@@ -119,6 +122,7 @@ def connect_database():
         # Limpiar estado previo
         app_state["db_connected"] = False
         product_manager.product_cache = pd.DataFrame()
+        product_manager.db_handler.invalidate_distinct_cache()
 
         # Intentar conexión
         success = product_manager.test_database_connection()
@@ -136,14 +140,17 @@ def connect_database():
                 f"📊 Configuración: {database_name}.{table_name} @ {instance_name}"
             )
 
-            # Obtener estadísticas y validar datos
+            # Obtener estadísticas y validar datos; ambas consultas son independientes,
+            # así que las estadísticas corren en paralelo con otra conexión del pool
             try:
-                stats = product_manager.get_statistics()
-                total_products = stats.get("total_products", 0)
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    stats_future = executor.submit(product_manager.db_handler.get_statistics)
 
-                # Hacer una consulta de prueba para validar datos
-                test_df = product_manager.refresh_products(use_filter=False)
-                valid_products = len(test_df)
+                    # Hacer una consulta de prueba para validar datos
+                    test_df = product_manager.refresh_products(use_filter=False)
+                    valid_products = len(test_df)
+
+                    total_products = stats_future.result().get("total_products", 0)
 
                 if valid_products > 0:
                     app_state["db_connected"] = True
@@ -267,7 +274,7 @@ def get_products():
             )
 
         # Convertir a lista de diccionarios
-        products = df.to_dict("records")
+        products = product_manager.to_records(df)
 
         return jsonify(
             {
@@ -305,7 +312,7 @@ def search_products():
         query = request.json.get("query", "")
         df = product_manager.search_products(query)
 
-        return jsonify({"success": True, "products": df.to_dict("records")})
+        return jsonify({"success": True, "products": product_manager.to_records(df)})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
@@ -5,23 +5,88 @@ Maneja las operaciones específicas de la plataforma
 
 import time
 import re
+import json
 from typing import Dict, Any, Optional, List, Callable
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException
 
 class StelNavigator:
     """Navegación específica para Stelorder"""
     
+    # Campo lógico -> id del elemento en el modal de Shop
+    _FIELD_MAPPING = {
+        'descripcion': 'descriptionShop',
+        'seo_titulo': 'seoTitleShop',
+        'seo_descripcion': 'seoDescriptionShop',
+        'destacado': 'destacadoShop'
+    }
+    
+    _SEO_KEYS = frozenset({'seo_titulo', 'seo_descripcion'})
+    
+    # Campos de texto plano que se actualizan en bloque vía CDP
+    _BATCH_FIELDS = ('seo_titulo', 'seo_descripcion')
+    
+    _BATCH_UPDATE_JS = """(function(values) {
+        var updated = [];
+        for (var id in values) {
+            var el = document.getElementById(id);
+            if (!el) continue;
+            el.value = values[id];
+            el.dispatchEvent(new Event('input', { bubbles: true }));
+            el.dispatchEvent(new Event('change', { bubbles: true }));
+            updated.push(id);
+        }
+        return updated;
+    })(%s)"""
+    
     def __init__(self, browser_manager):
         self.browser = browser_manager
         self.driver = browser_manager.driver
         self.wait = browser_manager.wait
         self.base_url = "https://www.stelorder.com/app/"
+        self.catalog_url = "https://app.stelorder.com/app/#main_catalogo"
         self.is_logged_in = False
         self.current_section = None
         
+    def _cdp(self, cmd: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Ejecuta un comando CDP; si el driver no lo soporta usa WebDriver"""
+        if hasattr(self.driver, "execute_cdp_cmd"):
+            return self.driver.execute_cdp_cmd(cmd, params)
+        
+        # Fallback para drivers sin CDP (no Chromium)
+        if cmd == "Page.navigate":
+            self.driver.get(params["url"])
+        elif cmd == "Page.reload":
+            self.driver.refresh()
+        elif cmd == "Runtime.evaluate":
+            value = self.driver.execute_script("return " + params["expression"])
+            return {"result": {"value": value}}
+        return {}
+    
+    def _wait_page_loaded(self, old_html=None, timeout: Optional[float] = None):
+        """
+        Espera a que el documento termine de cargar
+        Con old_html (el <html> previo a navegar) espera antes a que ese documento
+        se descarte: los comandos CDP vuelven antes de que la navegación se confirme
+        y el readyState del documento viejo ya es "complete".
+        """
+        timeout = timeout or self.browser.config.get("page_load_timeout", 30)
+        wait = WebDriverWait(self.driver, timeout)
+        if old_html is not None:
+            wait.until(EC.staleness_of(old_html))
+        wait.until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+    
+    def _cdp_navigate(self, url: str):
+        """Navega vía CDP Page.navigate y espera a que cargue el documento nuevo"""
+        old_html = self.driver.find_element(By.TAG_NAME, "html")
+        self._cdp("Page.navigate", {"url": url})
+        self._wait_page_loaded(old_html)
+    
     def navigate_to_login(self) -> Dict[str, Any]:
         """Navega a la página de login"""
         result = self.browser.navigate_to(self.base_url)
@@ -38,21 +103,21 @@ class StelNavigator:
         try:
             # Buscar elementos que indiquen que estamos logueados
             # Ajustar según la estructura real de Stelorder
-            logged_indicators = [
-                "//a[@id='ui-id-2']",  # Tab de catálogo
-                "//div[@class='header-usuario']",
-                "//button[contains(@class, 'logout')]"
-            ]
+            # Un solo XPath con "|" evalúa todos los indicadores en una pasada
+            logged_indicators = (
+                "//a[@id='ui-id-2']"  # Tab de catálogo
+                " | //div[@class='header-usuario']"
+                " | //button[contains(@class, 'logout')]"
+            )
             
-            for indicator in logged_indicators:
-                try:
-                    self.wait.until(EC.presence_of_element_located((By.XPATH, indicator)))
-                    self.is_logged_in = True
-                    return True
-                except:
-                    continue
-                    
-            return False
+            try:
+                WebDriverWait(self.driver, 3).until(
+                    EC.presence_of_element_located((By.XPATH, logged_indicators))
+                )
+                self.is_logged_in = True
+                return True
+            except TimeoutException:
+                return False
             
         except Exception as e:
             print(f"Error verificando login: {e}")
@@ -61,15 +126,13 @@ class StelNavigator:
     def navigate_to_catalog(self) -> Dict[str, Any]:
         """Navega al catálogo de productos"""
         try:
-            # Método 1: URL directa
-            self.driver.get("about:blank")
-            time.sleep(1)
-            self.driver.get("https://app.stelorder.com/app/#main_catalogo")
-            time.sleep(5)
+            # Método 1: URL directa (vía CDP, esperando la carga en lugar de sleeps fijos)
+            self._cdp_navigate("about:blank")
+            self._cdp_navigate(self.catalog_url)
             
-            # Refrescar página
+            # Refrescar página (refresh de WebDriver bloquea hasta que carga el documento nuevo)
             self.driver.refresh()
-            time.sleep(3)
+            self._wait_page_loaded()
             
             # Método 2: Click en pestaña
             try:
@@ -138,6 +201,17 @@ class StelNavigator:
     def select_product_from_results(self, sku: str) -> Dict[str, Any]:
         """Selecciona un producto de los resultados de búsqueda"""
         try:
+            # Camino rápido: si la búsqueda dejó una sola fila, seleccionarla directamente
+            rows_count = self.driver.execute_script(
+                "return document.querySelectorAll('table.tablaListado tr.lineaTD').length;"
+            )
+            if rows_count == 1:
+                self.driver.execute_script(
+                    "document.querySelector('table.tablaListado tr.lineaTD').click();"
+                )
+                time.sleep(3)
+                return {"success": True, "message": "Producto seleccionado"}
+            
             # Buscar en la tabla de resultados
             filas = self.driver.find_elements(By.XPATH, "//table[@class='tablaListado']//tr[@class='lineaTD']")
             
@@ -169,25 +243,23 @@ class StelNavigator:
     def navigate_to_shop_tab(self) -> Dict[str, Any]:
         """Navega a la pestaña Shop del producto"""
         try:
-            # Intentar diferentes selectores
+            # Intentar diferentes selectores a la vez, con un único timeout
             selectors = [
                 "//a[@id='ui-id-31']",
                 "//li[contains(@class, 'ui-tabs-tab')]/a[contains(text(), 'Shop')]",
                 "//a[contains(text(), 'Shop')]"
             ]
             
-            for selector in selectors:
-                try:
-                    shop_tab = self.wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
-                    self.driver.execute_script("arguments[0].scrollIntoView(true);", shop_tab)
-                    time.sleep(1)
-                    self.driver.execute_script("arguments[0].click();", shop_tab)
-                    time.sleep(3)
-                    return {"success": True, "message": "Pestaña Shop activada"}
-                except:
-                    continue
-                    
-            return {"success": False, "error": "No se encontró la pestaña Shop"}
+            try:
+                shop_tab = self.wait.until(self._any_clickable(selectors))
+            except TimeoutException:
+                return {"success": False, "error": "No se encontró la pestaña Shop"}
+            
+            self.driver.execute_script("arguments[0].scrollIntoView(true);", shop_tab)
+            time.sleep(1)
+            self.driver.execute_script("arguments[0].click();", shop_tab)
+            time.sleep(3)
+            return {"success": True, "message": "Pestaña Shop activada"}
             
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -201,9 +273,19 @@ class StelNavigator:
                 "//button[contains(@class, 'editarShop')]"
             ]
             
+            # Un único timeout para que aparezca alguno de los botones
+            try:
+                self.wait.until(self._any_clickable(selectors))
+            except TimeoutException:
+                return {"success": False, "error": "No se pudo abrir el editor"}
+            
+            # Si el modal no se abre con un botón se prueba el del selector siguiente;
+            # los selectores sin botón clickeable en este momento se saltean sin esperar
             for selector in selectors:
                 try:
-                    edit_btn = self.wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
+                    edit_btn = EC.element_to_be_clickable((By.XPATH, selector))(self.driver)
+                    if not edit_btn:
+                        continue
                     self.driver.execute_script("arguments[0].scrollIntoView(true);", edit_btn)
                     time.sleep(1)
                     self.driver.execute_script("arguments[0].click();", edit_btn)
@@ -216,7 +298,7 @@ class StelNavigator:
                     
                     if modal:
                         return {"success": True, "message": "Modal de edición abierto"}
-                except:
+                except Exception:
                     continue
                     
             return {"success": False, "error": "No se pudo abrir el editor"}
@@ -224,6 +306,11 @@ class StelNavigator:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @staticmethod
+    def _any_clickable(selectors: List[str]):
+        """Condición que se cumple con el primer selector XPath clickeable"""
+        return EC.any_of(*(EC.element_to_be_clickable((By.XPATH, selector)) for selector in selectors))
+    
     def update_shop_fields(self, fields: Dict[str, str]) -> Dict[str, Any]:
         """Actualiza los campos del producto en el modal de Shop"""
         try:
@@ -235,7 +322,7 @@ class StelNavigator:
             )
             
             # Mostrar campos SEO si es necesario
-            if any(key.startswith('seo') for key in fields.keys()):
+            if not self._SEO_KEYS.isdisjoint(fields):
                 try:
                     show_seo = modal.find_element(By.ID, "trMostrarOcultarCamposSeoShopTable")
                     self.driver.execute_script("arguments[0].click();", show_seo)
@@ -244,14 +331,17 @@ class StelNavigator:
                     pass
             
             # Actualizar cada campo
-            field_mapping = {
-                'descripcion': 'descriptionShop',
-                'seo_titulo': 'seoTitleShop',
-                'seo_descripcion': 'seoDescriptionShop',
-                'destacado': 'destacadoShop'
-            }
+            field_mapping = self._FIELD_MAPPING
+            
+            # Campos de texto simples: un único Runtime.evaluate para todos
+            batch = {key: fields[key] for key in self._BATCH_FIELDS if key in fields}
+            if batch:
+                self._update_fields_batch(batch, field_mapping, results)
             
             for field_key, field_value in fields.items():
+                if field_key in batch:
+                    continue
+                
                 if field_key in field_mapping:
                     try:
                         element_id = field_mapping[field_key]
@@ -310,6 +400,30 @@ class StelNavigator:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def _update_fields_batch(self, batch: Dict[str, str], field_mapping: Dict[str, str],
+                             results: Dict[str, List]):
+        """Actualiza varios campos de texto con un solo Runtime.evaluate"""
+        values = {field_mapping[key]: value for key, value in batch.items()}
+        expression = self._BATCH_UPDATE_JS % json.dumps(values)
+        
+        try:
+            response = self._cdp("Runtime.evaluate", {
+                "expression": expression,
+                "returnByValue": True,
+                "awaitPromise": False
+            })
+            updated_ids = set(response.get("result", {}).get("value") or [])
+        except Exception as e:
+            for field_key in batch:
+                results["failed"].append({"field": field_key, "error": str(e)})
+            return
+        
+        for field_key in batch:
+            if field_mapping[field_key] in updated_ids:
+                results["updated"].append(field_key)
+            else:
+                results["failed"].append({"field": field_key, "error": "Campo no encontrado"})
+    
     def save_shop_changes(self) -> Dict[str, Any]:
         """Guarda los cambios del modal de Shop"""
         try:
@@ -353,15 +467,16 @@ class StelNavigator:
             "error": None
         }
         
+        # Un único payload reutilizado en cada paso (el callback debe copiarlo si lo guarda)
+        cb = progress_callback
+        payload = {"step": 0, "total": len(steps), "description": None, "sku": sku} if cb else None
+        
         for i, (step_name, step_func) in enumerate(steps):
             try:
-                if progress_callback:
-                    progress_callback({
-                        "step": i + 1,
-                        "total": len(steps),
-                        "description": step_name,
-                        "sku": sku
-                    })
+                if payload is not None:
+                    payload["step"] = i + 1
+                    payload["description"] = step_name
+                    cb(payload)
                 
                 step_result = step_func()
                 
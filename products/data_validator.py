@@ -6,12 +6,20 @@ Detecta y corrige problemas comunes en los datos de la base de datos
 import pandas as pd
 import numpy as np
 import re
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional, Iterable
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 class DataValidator:
     """Validador de calidad de datos para productos"""
     
+    # Columnas cuya versión str se calcula una sola vez por validación
+    STR_CACHED_FIELDS = ('SKU', 'Descripción')
+    
+    # quick_validate: filas de la muestra inicial y distancia al 50% que se considera concluyente
+    QUICK_SAMPLE_ROWS = 64
+    QUICK_SAMPLE_MARGIN = 0.25
+    
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
@@ -29,10 +37,19 @@ class DataValidator:
             'Marca': ['Marca', 'marca', 'SKU', 'Descripción', 'Familia'],
             'Familia': ['Familia', 'familia', 'SKU', 'Descripción', 'Marca']
         }
+        self.invalid_values = {col: frozenset(values) for col, values in self.invalid_values.items()}
+        
+        # SKUs que no cuentan como duplicados (probables encabezados o vacíos)
+        self.invalid_skus = frozenset(['SKU', 'sku', '', None])
     
-    def validate_dataframe(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    def validate_dataframe(self, df: pd.DataFrame, sql_prefiltered: bool = False,
+                           diagnostics: bool = True) -> Tuple[pd.DataFrame, Dict[str, Any]]:
         """
         Valida y limpia un DataFrame completo
+        Si sql_prefiltered es True, se omiten los pasos que ya aplicó la consulta
+        (ver get_sql_filter): filas de encabezado y campos obligatorios.
+        Con diagnostics=False no se detectan anomalías ni se calcula el puntaje de
+        calidad (solo informan, no modifican los datos).
         Retorna: (DataFrame limpio, reporte de validación)
         """
         if df.empty:
@@ -43,30 +60,135 @@ class DataValidator:
         original_count = len(df)
         issues = []
         
-        # 1. Detectar y remover filas de encabezado
-        df_clean, header_issues = self._remove_header_rows(df)
-        issues.extend(header_issues)
-        
-        # 2. Validar campos obligatorios
-        df_clean, required_issues = self._validate_required_fields(df_clean)
-        issues.extend(required_issues)
+        # Conversión a str compartida por todos los pasos (se mantiene alineada al filtrar);
+        # solo la usan los pasos 1, 2 y 5
+        str_cache = {}
+        if diagnostics or not sql_prefiltered:
+            str_cache = {col: df[col].astype(str) for col in self.STR_CACHED_FIELDS if col in df.columns}
+        
+        df_clean = df
+        if not sql_prefiltered:
+            # 1. Detectar y remover filas de encabezado
+            df_clean, header_issues = self._remove_header_rows(df_clean, str_cache=str_cache)
+            issues.extend(header_issues)
+            
+            # 2. Validar campos obligatorios
+            df_clean, required_issues = self._validate_required_fields(df_clean, str_cache=str_cache)
+            issues.extend(required_issues)
         
         # 3. Detectar filas duplicadas
-        df_clean, duplicate_issues = self._remove_duplicates(df_clean)
+        df_clean, duplicate_issues = self._remove_duplicates(df_clean, str_cache=str_cache)
         issues.extend(duplicate_issues)
         
+        # Los pasos 1-3 conservan el índice original (no contiguo); se reindexa una sola vez
+        df_clean = df_clean.reset_index(drop=True)
+        str_cache = {field: values.reset_index(drop=True) for field, values in str_cache.items()}
+        
         # 4. Validar tipos de datos
-        df_clean, type_issues = self._validate_data_types(df_clean)
+        numeric_cache = {}
+        df_clean, type_issues = self._validate_data_types(df_clean, numeric_cache=numeric_cache)
         issues.extend(type_issues)
         
         # 5. Detectar anomalías en los datos
-        anomaly_issues = self._detect_anomalies(df_clean)
-        issues.extend(anomaly_issues)
+        if diagnostics:
+            anomaly_issues = self._detect_anomalies(df_clean, str_cache=str_cache, numeric_cache=numeric_cache)
+            issues.extend(anomaly_issues)
         
+        report = self._build_report(df_clean, original_count, issues, quality_score=diagnostics)
+        
+        return df_clean, report
+    
+    def validate_iter(self, chunks: Iterable[pd.DataFrame]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Valida un DataFrame que llega en bloques (p.ej. DatabaseHandler.iter_all_products)
+        Mientras se valida un bloque se va leyendo el siguiente en segundo plano.
+        Retorna: (DataFrame limpio, reporte de validación)
+        """
+        original_count = 0
+        issues_by_key: Dict[Tuple, Dict] = {}
+        pieces = []
+        seen_skus = set()
+        
+        def _merge(new_issues: List[Dict]):
+            for issue in new_issues:
+                key = (issue['type'], issue.get('field'))
+                if key in issues_by_key:
+                    merged = issues_by_key[key]
+                    merged['count'] += issue['count']
+                    if issue['type'] == 'header_row_detected':
+                        merged['description'] = (f"Detectadas y removidas {merged['count']} filas "
+                                                 f"que parecían ser encabezados.")
+                else:
+                    issues_by_key[key] = dict(issue)
+        
+        iterator = iter(chunks)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(next, iterator, None)
+            while True:
+                chunk = pending.result()
+                if chunk is None:
+                    break
+                pending = executor.submit(next, iterator, None)
+                
+                if chunk.empty:
+                    continue
+                original_count += len(chunk)
+                
+                # Pasos 1-4 sobre el bloque
+                str_cache = {col: chunk[col].astype(str) for col in self.STR_CACHED_FIELDS if col in chunk.columns}
+                chunk_clean, header_issues = self._remove_header_rows(chunk, str_cache=str_cache)
+                chunk_clean, required_issues = self._validate_required_fields(chunk_clean, str_cache=str_cache)
+                chunk_clean, duplicate_issues = self._remove_duplicates(chunk_clean, str_cache=str_cache)
+                chunk_clean, type_issues = self._validate_data_types(chunk_clean.reset_index(drop=True))
+                
+                # Duplicados entre bloques
+                if 'SKU' in chunk_clean.columns and not chunk_clean.empty:
+                    repeated = chunk_clean['SKU'].isin(seen_skus).to_numpy()
+                    if repeated.any():
+                        duplicate_issues.append({
+                            'type': 'duplicate_sku',
+                            'count': int(repeated.sum()),
+                            'description': 'SKUs duplicados encontrados'
+                        })
+                        chunk_clean = chunk_clean[~repeated]
+                    seen_skus.update(chunk_clean['SKU'].tolist())
+                    seen_skus.difference_update(self.invalid_skus)
+                
+                _merge(header_issues + required_issues + duplicate_issues + type_issues)
+                pieces.append(chunk_clean)
+        
+        if not pieces:
+            return pd.DataFrame(), {'status': 'empty', 'issues': [], 'stats': {}}
+        
+        df_clean = pd.concat(pieces, ignore_index=True)
+        
+        # 5. Anomalías sobre el conjunto completo (usan cuantiles globales)
+        _merge(self._detect_anomalies(df_clean))
+        
+        return df_clean, self._build_report(df_clean, original_count, list(issues_by_key.values()))
+    
+    def get_sql_filter(self) -> str:
+        """
+        Predicados SQL (a anexar tras un WHERE) equivalentes a los pasos 1 y 2:
+        descarta filas de encabezado y filas sin SKU/Descripción.
+        """
+        header_terms = []
+        for col, invalid_list in self.invalid_values.items():
+            literals = ", ".join("'" + value.replace("'", "''") + "'" for value in sorted(invalid_list))
+            header_terms.append(f"COALESCE({col} IN ({literals}), 0)")
+        
+        return (
+            "SKU IS NOT NULL AND TRIM(SKU) != '' "
+            "AND Descripción IS NOT NULL AND TRIM(Descripción) != '' "
+            f"AND ({' + '.join(header_terms)}) < 2"
+        )
+    
+    def _build_report(self, df_clean: pd.DataFrame, original_count: int,
+                      issues: List[Dict], quality_score: bool = True) -> Dict[str, Any]:
+        """Genera el reporte de validación (data_quality_score es None si quality_score es False)"""
         final_count = len(df_clean)
         removed_count = original_count - final_count
         
-        # Generar reporte
         report = {
             'status': 'completed',
             'stats': {
@@ -76,27 +198,55 @@ class DataValidator:
                 'removal_percentage': (removed_count / original_count * 100) if original_count > 0 else 0
             },
             'issues': issues,
-            'data_quality_score': self._calculate_quality_score(df_clean)
+            'data_quality_score': self._calculate_quality_score(df_clean) if quality_score else None
         }
         
         self.logger.info(f"DataValidator: Validación completada - {final_count}/{original_count} filas válidas")
         
-        return df_clean, report
+        return report
+    
+    @staticmethod
+    def _str_column(df: pd.DataFrame, field: str,
+                    str_cache: Optional[Dict[str, pd.Series]] = None) -> pd.Series:
+        """Devuelve df[field] como str, reutilizando la caché si está disponible"""
+        if str_cache is not None and field in str_cache:
+            return str_cache[field]
+        return df[field].astype(str)
+    
+    def _null_and_blank(self, df: pd.DataFrame, field: str,
+                        str_cache: Optional[Dict[str, pd.Series]] = None) -> Tuple[pd.Series, pd.Series]:
+        """Máscaras de nulos y de texto vacío (tras strip) de una columna, en una sola pasada"""
+        null_mask = df[field].isna()
+        blank_mask = self._str_column(df, field, str_cache).str.strip() == ''
+        return null_mask, blank_mask
+    
+    @staticmethod
+    def _sync_str_cache(str_cache: Optional[Dict[str, pd.Series]], keep_mask) -> None:
+        """Aplica a la caché el mismo filtro de filas que al DataFrame"""
+        if not str_cache:
+            return
+        keep = np.asarray(keep_mask, dtype=bool)
+        for field, values in str_cache.items():
+            str_cache[field] = values[keep]
     
-    def _remove_header_rows(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict]]:
-        """Detecta y remueve filas que contienen nombres de columnas como datos"""
+    def _remove_header_rows(self, df: pd.DataFrame,
+                            str_cache: Optional[Dict[str, pd.Series]] = None) -> Tuple[pd.DataFrame, List[Dict]]:
+        """
+        Detecta y remueve filas que contienen nombres de columnas como datos
+        Conserva el índice de df (no contiguo); validate_dataframe lo reinicia al final.
+        """
         issues = []
         if df.empty:
             return df, issues
 
         # Contar cuántas columnas de una fila coinciden con valores de encabezado
-        header_match_count = pd.DataFrame(index=df.index, columns=self.invalid_values.keys(), dtype=int)
-        for col, invalid_list in self.invalid_values.items():
-            if col in df.columns:
-                header_match_count[col] = df[col].isin(invalid_list).astype(int)
+        header_cols = [col for col in self.invalid_values if col in df.columns]
+        header_match_count = np.zeros(len(df), dtype=np.int8)
+        for col in header_cols:
+            header_match_count += df[col].isin(self.invalid_values[col]).to_numpy(dtype=np.int8)
         
         # Una fila se considera un encabezado si al menos 2 de sus campos coinciden
-        is_header_mask = header_match_count.sum(axis=1) >= 2
+        is_header_mask = pd.Series(header_match_count >= 2, index=df.index)
 
         # Contar cuántas filas se van a eliminar
         header_rows_count = is_header_mask.sum()
@@ -110,31 +260,26 @@ class DataValidator:
             self.logger.info(f"_remove_header_rows: Removiendo {header_rows_count} filas de encabezado.")
             
             # Devolver el DataFrame sin las filas de encabezado
-            return df[~is_header_mask].reset_index(drop=True), issues
+            self._sync_str_cache(str_cache, ~is_header_mask)
+            return df[~is_header_mask], issues
         
         return df, issues
     
-    def _validate_required_fields(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict]]:
-        """Valida que los campos obligatorios tengan valores válidos"""
+    def _validate_required_fields(self, df: pd.DataFrame,
+                                  str_cache: Optional[Dict[str, pd.Series]] = None) -> Tuple[pd.DataFrame, List[Dict]]:
+        """Valida que los campos obligatorios tengan valores válidos (conserva el índice)"""
         issues = []
         
         if df.empty:
             return df, issues
         
-        required_fields = ['SKU', 'Descripción']
-        valid_mask = pd.Series([True] * len(df))
+        required_fields = [field for field in ('SKU', 'Descripción') if field in df.columns]
+        valid_mask = pd.Series(True, index=df.index)
         
         for field in required_fields:
-            if field not in df.columns:
-                continue
-            
-            # REGLA RELAJADA: Se reduce la longitud mínima a 1
-            field_mask = (
-                df[field].notna() &
-                (df[field].astype(str).str.strip() != '') &
-                (df[field].astype(str).str.len() >= 1)
-            )
-            
+            # REGLA RELAJADA: Se reduce la longitud mínima a 1 (implícita en "no vacío")
+            null_mask, blank_mask = self._null_and_blank(df, field, str_cache)
+            field_mask = ~(null_mask | blank_mask)
             invalid_count = (~field_mask).sum()
             if invalid_count > 0:
                 valid_mask &= field_mask
@@ -151,26 +296,25 @@ class DataValidator:
             for _, row in removed_df.head(3).iterrows():
                 self.logger.warning(f"  - Fila removida (required): {row.to_dict()}")
 
-        df_clean = df[valid_mask].reset_index(drop=True)
+        self._sync_str_cache(str_cache, valid_mask)
+        df_clean = df[valid_mask]
         return df_clean, issues
     
-    def _remove_duplicates(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict]]:
-        """Detecta y remueve filas duplicadas"""
+    def _remove_duplicates(self, df: pd.DataFrame,
+                           str_cache: Optional[Dict[str, pd.Series]] = None) -> Tuple[pd.DataFrame, List[Dict]]:
+        """Detecta y remueve filas duplicadas (conserva el índice)"""
         issues = []
         
         if df.empty or 'SKU' not in df.columns:
             return df, issues
         
         # Detectar duplicados por SKU, ignorando el SKU 'SKU' que es probablemente un header
-        # y otros valores no válidos.
-        valid_sku_mask = ~df['SKU'].isin(['SKU', 'sku', None, ''])
-        
-        # Aplicar la detección de duplicados solo a las filas con SKUs válidos
-        duplicate_mask = df[valid_sku_mask].duplicated(subset=['SKU'], keep='first')
-        
-        # Re-indexar la máscara para que coincida con el DataFrame original
-        duplicate_mask = duplicate_mask.reindex(df.index, fill_value=False)
-        duplicate_count = duplicate_mask.sum()
+        # y otros valores no válidos. Un SKU válido solo puede repetir a otro válido, así que
+        # basta con un duplicated sobre la columna completa.
+        sku = df['SKU']
+        duplicate_mask = (sku.duplicated(keep='first').to_numpy()
+                          & ~sku.isin(self.invalid_skus).to_numpy())
+        duplicate_count = int(duplicate_mask.sum())
         
         if duplicate_count > 0:
             issues.append({
@@ -185,11 +329,16 @@ class DataValidator:
             for _, row in removed_df.head(3).iterrows():
                 self.logger.warning(f"  - Fila removida (duplicate): {row.to_dict()}")
 
-        df_clean = df[~duplicate_mask].reset_index(drop=True)
+        self._sync_str_cache(str_cache, ~duplicate_mask)
+        df_clean = df[~duplicate_mask]
         return df_clean, issues
     
-    def _validate_data_types(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict]]:
-        """Valida tipos de datos y convierte cuando es necesario"""
+    def _validate_data_types(self, df: pd.DataFrame,
+                             numeric_cache: Optional[Dict[str, pd.Series]] = None) -> Tuple[pd.DataFrame, List[Dict]]:
+        """
+        Valida tipos de datos y convierte cuando es necesario
+        Si se pasa numeric_cache, guarda ahí las columnas convertidas.
+        """
         issues = []
         
         if df.empty:
@@ -197,17 +346,20 @@ class DataValidator:
         
         # Validar campos numéricos
         numeric_fields = ['Precio_USD_con_IVA', 'Stock', 'Potencia_Numerica']
+        cols = set(df.columns)
         
         for field in numeric_fields:
-            if field not in df.columns:
+            if field not in cols:
                 continue
             
             # Intentar convertir a numérico
-            original_values = df[field].copy()
+            original_nulls = df[field].isna().sum()
             df[field] = pd.to_numeric(df[field], errors='coerce')
+            if numeric_cache is not None:
+                numeric_cache[field] = df[field]
             
             # Contar conversiones fallidas
-            conversion_failures = df[field].isna().sum() - original_values.isna().sum()
+            conversion_failures = df[field].isna().sum() - original_nulls
             
             if conversion_failures > 0:
                 issues.append({
@@ -219,17 +371,23 @@ class DataValidator:
         
         return df, issues
     
-    def _detect_anomalies(self, df: pd.DataFrame) -> List[Dict]:
+    def _detect_anomalies(self, df: pd.DataFrame,
+                          str_cache: Optional[Dict[str, pd.Series]] = None,
+                          numeric_cache: Optional[Dict[str, pd.Series]] = None) -> List[Dict]:
         """Detecta anomalías en los datos"""
         issues = []
         
         if df.empty:
             return issues
         
+        cols = set(df.columns)
+        
         # Detectar SKUs con patrones anómalos
-        if 'SKU' in df.columns:
+        if 'SKU' in cols:
+            sku_str = self._str_column(df, 'SKU', str_cache)
+            
             # SKUs muy cortos
-            short_sku_count = (df['SKU'].astype(str).str.len() < 3).sum()
+            short_sku_count = (sku_str.str.len().to_numpy() < 3).sum()
             if short_sku_count > 0:
                 issues.append({
                     'type': 'anomaly_short_sku',
@@ -238,7 +396,7 @@ class DataValidator:
                 })
             
             # SKUs que son solo números
-            numeric_sku_count = df['SKU'].astype(str).str.match(r'^\d+$').sum()
+            numeric_sku_count = sku_str.str.isdigit().sum()
             if numeric_sku_count > len(df) * 0.8:  # Más del 80%
                 issues.append({
                     'type': 'anomaly_numeric_sku',
@@ -247,8 +405,8 @@ class DataValidator:
                 })
         
         # Detectar descripciones muy cortas
-        if 'Descripción' in df.columns:
-            short_desc_count = (df['Descripción'].astype(str).str.len() < 10).sum()
+        if 'Descripción' in cols:
+            short_desc_count = (self._str_column(df, 'Descripción', str_cache).str.len() < 10).sum()
             if short_desc_count > 0:
                 issues.append({
                     'type': 'anomaly_short_description',
@@ -257,11 +415,15 @@ class DataValidator:
                 })
         
         # Detectar precios anómalos
-        if 'Precio_USD_con_IVA' in df.columns:
-            numeric_prices = pd.to_numeric(df['Precio_USD_con_IVA'], errors='coerce')
+        if 'Precio_USD_con_IVA' in cols:
+            if numeric_cache is not None and 'Precio_USD_con_IVA' in numeric_cache:
+                numeric_prices = numeric_cache['Precio_USD_con_IVA']
+            else:
+                numeric_prices = pd.to_numeric(df['Precio_USD_con_IVA'], errors='coerce')
+            prices = numeric_prices.to_numpy(dtype=np.float64, na_value=np.nan)
             
             # Precios negativos
-            negative_prices = (numeric_prices < 0).sum()
+            negative_prices = np.count_nonzero(prices < 0)
             if negative_prices > 0:
                 issues.append({
                     'type': 'anomaly_negative_price',
@@ -270,9 +432,10 @@ class DataValidator:
                 })
             
             # Precios extremadamente altos
-            if not numeric_prices.empty:
-                q99 = numeric_prices.quantile(0.99)
-                extreme_prices = (numeric_prices > q99 * 10).sum()
+            valid_prices = prices[~np.isnan(prices)]
+            if valid_prices.size:
+                q99 = np.quantile(valid_prices, 0.99)
+                extreme_prices = np.count_nonzero(prices > q99 * 10)
                 if extreme_prices > 0:
                     issues.append({
                         'type': 'anomaly_extreme_price',
@@ -291,14 +454,15 @@ class DataValidator:
         
         # Penalizar por campos vacíos en columnas importantes
         important_fields = ['SKU', 'Descripción', 'Marca', 'Familia']
+        cols = set(df.columns)
+        present = [field for field in important_fields if field in cols]
         
-        for field in important_fields:
-            if field in df.columns:
-                null_percentage = df[field].isna().sum() / len(df)
-                score -= null_percentage * 20  # Penalizar hasta 20 puntos por campo
+        if present:
+            null_rates = df[present].isna().mean().to_numpy()
+            score -= float(null_rates.sum()) * 20  # Penalizar hasta 20 puntos por campo
         
         # Bonificar por diversidad de datos
-        if 'SKU' in df.columns:
+        if 'SKU' in cols:
             uniqueness = df['SKU'].nunique() / len(df)
             score += (uniqueness - 0.8) * 10 if uniqueness > 0.8 else 0
         
@@ -311,19 +475,26 @@ class DataValidator:
         
         # Verificar campos mínimos
         required_fields = ['SKU', 'Descripción']
-        if not all(field in df.columns for field in required_fields):
+        if not set(required_fields).issubset(df.columns):
             return False
         
-        # Verificar que no todas las filas sean headers
-        header_count = 0
-        for field in required_fields:
-            header_count += (df[field].astype(str).str.strip() == field).sum()
+        # Verificar que no todas las filas sean headers; primero sobre una muestra
+        # y solo si queda cerca del 50% sobre todas las filas
+        sample = df.head(self.QUICK_SAMPLE_ROWS)
+        header_ratio = self._header_ratio(sample, required_fields)
+        if len(sample) < len(df) and abs(header_ratio - 0.5) <= self.QUICK_SAMPLE_MARGIN:
+            header_ratio = self._header_ratio(df, required_fields)
         
         # Si más del 50% son headers, los datos no son utilizables
-        if header_count > len(df) * 0.5:
-            return False
-        
-        return True
+        return header_ratio <= 0.5
+    
+    @staticmethod
+    def _header_ratio(df: pd.DataFrame, fields: List[str]) -> float:
+        """Proporción de valores iguales al nombre de su columna respecto al total de filas"""
+        header_count = 0
+        for field in fields:
+            header_count += (df[field].astype(str).str.strip() == field).sum()
+        return header_count / len(df)
     
     def get_data_summary(self, df: pd.DataFrame) -> Dict[str, Any]:
         """Genera un resumen de los datos"""
@@ -337,12 +508,14 @@ class DataValidator:
         }
         
         # Estadísticas por columna
+        cols = set(df.columns)
         for col in ['SKU', 'Descripción', 'Marca', 'Familia']:
-            if col in df.columns:
+            if col in cols:
+                null_mask, blank_mask = self._null_and_blank(df, col)
                 summary[f'{col.lower()}_stats'] = {
                     'unique_count': df[col].nunique(),
-                    'null_count': df[col].isna().sum(),
-                    'empty_count': (df[col].astype(str).str.strip() == '').sum()
+                    'null_count': null_mask.sum(),
+                    'empty_count': blank_mask.sum()
                 }
         
         return summary
@@ -5,21 +5,243 @@ Gestiona la conexión y consultas a la base de datos
 
 import pymysql
 import pandas as pd
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
 import json
 from datetime import datetime
 from pathlib import Path
 import logging
+import time
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import quote_plus
 from google.cloud.sql.connector import Connector
+from openpyxl.utils import get_column_letter
 from .data_validator import DataValidator
 
+try:
+    import connectorx as cx
+except ImportError:  # Dependencia opcional: lectura columnar vía Arrow
+    cx = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    _ARROW_BACKEND = int(pd.__version__.split('.')[0]) >= 2
+except ImportError:
+    pa = pc = None
+    _ARROW_BACKEND = False
+
+try:
+    from sqlalchemy import event
+    from sqlalchemy.exc import DisconnectionError
+    from sqlalchemy.pool import QueuePool
+except ImportError:  # Dependencia opcional: sin pool se abre una conexión por llamada
+    QueuePool = None
+
+try:
+    import xlsxwriter  # noqa: F401
+    _XLSXWRITER = True
+except ImportError:  # Dependencia opcional: escritura de Excel más rápida que openpyxl
+    _XLSXWRITER = False
+
+# Columnas y direcciones permitidas en ORDER BY
+ORDER_COLUMNS = frozenset({'SKU', 'Descripción', 'Marca', 'Familia', 'Stock', 'Precio_USD_con_IVA', 'Potencia'})
+ORDER_DIRECTIONS = frozenset({'ASC', 'DESC'})
+
+# Descarta filas cuyo valor repite el nombre de su columna (encabezados importados);
+# <=> mantiene las filas con NULL
+_HEADER_ECHO_SQL = ("NOT (SKU <=> 'SKU' OR Descripción <=> 'Descripción' "
+                    "OR Marca <=> 'Marca' OR Familia <=> 'Familia')")
+
+# Fragmento WHERE de cada filtro, indexado por su nombre en la forma del filtro
+_FILTER_SQL = {
+    'familia': " AND Familia = %s",
+    'marca': " AND Marca = %s",
+    'stock_min': " AND CAST(Stock AS SIGNED) >= %s",
+    'stock_max': " AND CAST(Stock AS SIGNED) <= %s",
+    'stock_disponible': " AND (Stock = 'Disponible' OR CAST(Stock AS SIGNED) > 0)",
+    'stock_consultar': " AND Stock = 'Consultar'",
+    'precio_min': " AND CAST(Precio_USD_con_IVA AS DECIMAL(10,2)) >= %s",
+    'precio_max': " AND CAST(Precio_USD_con_IVA AS DECIMAL(10,2)) <= %s",
+    'potencia_min': " AND CAST(REGEXP_REPLACE(Potencia, '[^0-9.]', '') AS DECIMAL(10,2)) >= %s",
+    'potencia_max': " AND CAST(REGEXP_REPLACE(Potencia, '[^0-9.]', '') AS DECIMAL(10,2)) <= %s",
+    'combustible': " AND Combustible LIKE %s",
+    'con_cabina': " AND (Cabina IS NOT NULL AND Cabina != '' AND Cabina != 'Sin Cabina')",
+    'sin_cabina': " AND (Cabina IS NULL OR Cabina = '' OR Cabina = 'Sin Cabina')",
+    'con_tta': " AND (TTA_Incluido = 'Sí' OR TTA_Incluido = 'Si' OR TTA_Incluido = '1')",
+    'sin_tta': " AND (TTA_Incluido = 'No' OR TTA_Incluido = '0' OR TTA_Incluido IS NULL)",
+    'search_text': " AND (SKU LIKE %s OR Descripción LIKE %s OR Modelo LIKE %s OR Marca LIKE %s)",
+}
+
+# Columnas generadas (STORED, INVISIBLE e indexadas) con el valor numérico de los CAST de
+# _FILTER_SQL. REGEXP_SUBSTR toma solo el prefijo numérico, así el cálculo no genera
+# advertencias de truncado (que en modo estricto harían fallar los INSERT); un texto sin
+# número vale 0 y NULL sigue siendo NULL, igual que con CAST.
+_GENERATED_COLUMNS = {
+    'stock_num': (
+        "BIGINT",
+        "CASE WHEN Stock IS NULL THEN NULL ELSE COALESCE(CAST("
+        "REGEXP_SUBSTR(Stock, '^[[:space:]]*-?[0-9]+') AS SIGNED), 0) END",
+    ),
+    'precio_num': (
+        "DECIMAL(10,2)",
+        "CASE WHEN Precio_USD_con_IVA IS NULL THEN NULL ELSE COALESCE(CAST("
+        "REGEXP_SUBSTR(Precio_USD_con_IVA, '^[[:space:]]*-?[0-9]*[.]?[0-9]+') AS DECIMAL(10,2)), 0) END",
+    ),
+    'potencia_num': (
+        "DECIMAL(10,2)",
+        "CASE WHEN Potencia IS NULL THEN NULL ELSE COALESCE(CAST("
+        "REGEXP_SUBSTR(REGEXP_REPLACE(Potencia, '[^0-9.]', ''), '^[0-9]*[.]?[0-9]+') AS DECIMAL(10,2)), 0) END",
+    ),
+}
+
+# Variantes de _FILTER_SQL que usan las columnas generadas (config 'use_generated_columns')
+_FILTER_SQL_GENERATED = {
+    **_FILTER_SQL,
+    'stock_min': " AND stock_num >= %s",
+    'stock_max': " AND stock_num <= %s",
+    'stock_disponible': " AND (Stock = 'Disponible' OR stock_num > 0)",
+    'precio_min': " AND precio_num >= %s",
+    'precio_max': " AND precio_num <= %s",
+    'potencia_min': " AND potencia_num >= %s",
+    'potencia_max': " AND potencia_num <= %s",
+}
+
+
+def _filter_shape_and_params(filters: Dict[str, Any]) -> Tuple[Tuple[str, ...], List[Any]]:
+    """Traduce los filtros a (forma, parámetros); la forma indexa _FILTER_SQL"""
+    shape = []
+    params = []
+    
+    if filters.get('familia'):
+        shape.append('familia')
+        params.append(filters['familia'])
+    
+    if filters.get('marca'):
+        shape.append('marca')
+        params.append(filters['marca'])
+    
+    for key in ('stock_min', 'stock_max'):
+        if filters.get(key) is not None:
+            shape.append(key)
+            params.append(filters[key])
+    
+    if filters.get('stock_disponible'):
+        shape.append('stock_disponible')
+    
+    if filters.get('stock_consultar'):
+        shape.append('stock_consultar')
+    
+    for key in ('precio_min', 'precio_max', 'potencia_min', 'potencia_max'):
+        if filters.get(key) is not None:
+            shape.append(key)
+            params.append(filters[key])
+    
+    if filters.get('combustible'):
+        shape.append('combustible')
+        params.append(f"%{filters['combustible']}%")
+    
+    if filters.get('has_cabina') is not None:
+        shape.append('con_cabina' if filters['has_cabina'] else 'sin_cabina')
+    
+    if filters.get('has_tta') is not None:
+        shape.append('con_tta' if filters['has_tta'] else 'sin_tta')
+    
+    if filters.get('search_text'):
+        search = f"%{filters['search_text']}%"
+        shape.append('search_text')
+        params.extend([search, search, search, search])
+    
+    return tuple(shape), params
+
+
+@lru_cache(maxsize=128)
+def _build_filtered_query(table: str, shape: Tuple[str, ...], order_by: str,
+                          order_dir: str, has_limit: bool, generated: bool = False) -> str:
+    """Plantilla SQL para una forma de filtro; el resultado es idéntico para la misma forma"""
+    fragments = _FILTER_SQL_GENERATED if generated else _FILTER_SQL
+    query = f"SELECT * FROM {table} WHERE {_HEADER_ECHO_SQL}" + "".join(fragments[key] for key in shape)
+    query += f" ORDER BY {order_by} {order_dir}"
+    if has_limit:
+        query += " LIMIT %s"
+    return query
+
+
+@lru_cache(maxsize=32)
+def _build_ids_query(table: str, count: int) -> str:
+    """Plantilla SELECT ... WHERE SKU IN (%s, ...) para count parámetros"""
+    placeholders = ', '.join(['%s'] * count)
+    return f"SELECT * FROM {table} WHERE SKU IN ({placeholders})"
+
+
+@lru_cache(maxsize=32)
+def _build_update_query(table: str, field: str) -> str:
+    """UPDATE de un campo para un SKU (field ya validado contra UPDATABLE_FIELDS)"""
+    return f"UPDATE {table} SET `{field}` = %s WHERE SKU = %s"
+
+
+@lru_cache(maxsize=64)
+def _build_case_update(table: str, field: str, count: int) -> str:
+    """UPDATE de count filas en una sola sentencia: SET campo = CASE SKU WHEN ... END"""
+    whens = " ".join(["WHEN %s THEN %s"] * count)
+    placeholders = ', '.join(['%s'] * count)
+    return (f"UPDATE {table} SET `{field}` = CASE SKU {whens} END "
+            f"WHERE SKU IN ({placeholders})")
+
+
 class DatabaseHandler:
     """Maneja la conexión y operaciones con MySQL"""
     
+    # Columnas que se pueden modificar desde la aplicación
+    UPDATABLE_FIELDS = frozenset({
+        'Descripción', 'Marca', 'Modelo', 'Familia', 'Stock', 'Precio_USD_con_IVA',
+        'Potencia', 'Combustible', 'Cabina', 'TTA_Incluido', 'Motor', 'Tensión', 'URL_PDF'
+    })
+    
+    # Columnas sobre las que se pueden pedir valores únicos
+    DISTINCT_COLUMNS = UPDATABLE_FIELDS | {'SKU'}
+    
+    # Columnas que _shrink_dataframe no pasa a category (se usan como números o son únicas)
+    SHRINK_SKIP_COLUMNS = frozenset({'SKU', 'Stock', 'Precio_USD_con_IVA'})
+    
+    # Filas por executemany en actualizaciones masivas
+    BULK_BATCH_SIZE = 1000
+    
+    # Segundos que se reutilizan los valores únicos de una columna (listas de filtros)
+    DISTINCT_CACHE_TTL = 300
+    
+    # A partir de cuántos SKUs get_products_by_ids usa una tabla temporal en lugar de IN (...)
+    IDS_TEMP_TABLE_THRESHOLD = 1000
+    
+    # Filas por fetchmany al leer con cursor del lado del servidor
+    STREAM_FETCH_ROWS = 10_000
+    
+    # Conexiones persistentes del pool (más las temporales de max_overflow)
+    POOL_SIZE = 4
+    POOL_MAX_OVERFLOW = 4
+    # Segundos tras los que una conexión del pool se reemplaza (evita cortes por inactividad)
+    POOL_RECYCLE_SECONDS = 1800
+    
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or self._load_config_from_file()
         self.logger = logging.getLogger(__name__)
         self.connector = Connector()
+        self._distinct_cache: Dict[str, Tuple[float, List[str]]] = {}
+        self._pool = None
+        if QueuePool is not None:
+            # Sin dialecto el pool no admite pre_ping: el ping se hace en el evento checkout
+            self._pool = QueuePool(self._create_connection, pool_size=self.POOL_SIZE,
+                                   max_overflow=self.POOL_MAX_OVERFLOW,
+                                   recycle=self.POOL_RECYCLE_SECONDS)
+            event.listen(self._pool, 'checkout', self._ping_on_checkout)
+
+    @staticmethod
+    def _ping_on_checkout(dbapi_connection, connection_record, connection_proxy):
+        """Descarta conexiones caídas antes de entregarlas (el pool reintenta con una nueva)"""
+        try:
+            dbapi_connection.ping(reconnect=False)
+        except Exception as e:
+            raise DisconnectionError(f"Conexión del pool caída: {e}")
 
     def _load_config_from_file(self) -> Dict[str, Any]:
         """Carga configuración desde archivo"""
@@ -33,7 +255,22 @@ class DatabaseHandler:
         return {}
 
     def get_connection(self):
-        """Crea y retorna una nueva conexión a la base de datos."""
+        """
+        Retorna una conexión a la base de datos.
+        Con pool, close() la devuelve al pool en lugar de cerrarla.
+        """
+        if self._pool is not None:
+            return self._pool.connect()
+        return self._create_connection()
+    
+    def dispose(self):
+        """Cierra las conexiones del pool y el conector de Cloud SQL"""
+        if self._pool is not None:
+            self._pool.dispose()
+        self.connector.close()
+
+    def _create_connection(self):
+        """Crea una nueva conexión a la base de datos."""
         use_cloud_sql = self.config.get("use_cloud_sql", False)
         db_user = self.config.get("user")
         db_pass = self.config.get("password")
@@ -51,7 +288,7 @@ class DatabaseHandler:
                 user=db_user,
                 password=db_pass,
                 db=db_name,
-                cursorclass=pymysql.cursors.DictCursor
+                cursorclass=pymysql.cursors.Cursor
             )
         else:
             db_host = self.config.get("host")
@@ -66,9 +303,114 @@ class DatabaseHandler:
                 user=db_user,
                 password=db_pass,
                 database=db_name,
-                cursorclass=pymysql.cursors.DictCursor
+                cursorclass=pymysql.cursors.Cursor
             )
 
+    def _connectorx_uri(self) -> Optional[str]:
+        """URI de conexión para connectorx (solo MySQL local)"""
+        if cx is None or self.config.get("use_cloud_sql", False):
+            return None
+        
+        db_host = self.config.get("host")
+        db_port = self.config.get("port")
+        db_user = self.config.get("user")
+        db_name = self.config.get("database")
+        if not all([db_host, db_port, db_user, db_name]):
+            return None
+        
+        db_pass = quote_plus(self.config.get("password") or "")
+        return f"mysql://{quote_plus(db_user)}:{db_pass}@{db_host}:{int(db_port)}/{db_name}"
+    
+    def _read_sql_fast(self, query: str, connection=None, params=None) -> pd.DataFrame:
+        """Lee una consulta a DataFrame, vía connectorx/Arrow cuando es posible"""
+        # connectorx no admite parámetros enlazados ni el conector de Cloud SQL
+        uri = self._connectorx_uri() if not params else None
+        if uri is not None:
+            try:
+                table = cx.read_sql(uri, query, return_type="arrow")
+                if _ARROW_BACKEND:
+                    return table.to_pandas(self_destruct=True, types_mapper=pd.ArrowDtype)
+                return table.to_pandas(self_destruct=True)
+            except Exception as e:
+                self.logger.warning(f"_read_sql_fast: connectorx falló, usando SSCursor: {e}")
+        
+        if connection is None:
+            connection = self.get_connection()
+            try:
+                return self._read_sql_streaming(query, connection, params)
+            finally:
+                connection.close()
+        return self._read_sql_streaming(query, connection, params)
+    
+    def _read_sql_streaming(self, query: str, connection, params=None) -> pd.DataFrame:
+        """
+        Lee una consulta con SSCursor (sin buffer del lado del cliente)
+        Cada bloque de STREAM_FETCH_ROWS filas se convierte enseguida, así las tuplas
+        de pymysql nunca conviven con el DataFrame completo.
+        """
+        blocks = []
+        columns = []
+        for block in self._iter_sql_blocks(query, connection, params, self.STREAM_FETCH_ROWS):
+            columns = block.columns
+            if block.empty:
+                continue
+            if _ARROW_BACKEND:
+                block = pa.Table.from_pandas(block, preserve_index=False)
+            blocks.append(block)
+        
+        if not blocks:
+            return pd.DataFrame(columns=columns)
+        if _ARROW_BACKEND:
+            table = pa.concat_tables(blocks, promote_options="default")
+            del blocks
+            return table.to_pandas(self_destruct=True, types_mapper=pd.ArrowDtype)
+        return pd.concat(blocks, ignore_index=True)
+    
+    @staticmethod
+    def _iter_sql_blocks(query: str, connection, params=None,
+                         block_rows: int = 10_000) -> Iterator[pd.DataFrame]:
+        """Ejecuta la consulta con SSCursor y entrega bloques de hasta block_rows filas"""
+        with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(query, params)
+            columns = [col[0] for col in cursor.description]
+            any_rows = False
+            while True:
+                rows = cursor.fetchmany(block_rows)
+                if not rows:
+                    if not any_rows:
+                        # Sin filas: un bloque vacío conserva los nombres de columna
+                        yield pd.DataFrame(columns=columns)
+                    break
+                any_rows = True
+                # coerce_float: mismo trato de DECIMAL que pd.read_sql
+                yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    
+    @staticmethod
+    def _count_unique(series: pd.Series) -> int:
+        """nunique; con columnas Arrow cuenta directamente sobre el arreglo (sin pasar por objetos)"""
+        if pc is not None and isinstance(series.dtype, pd.ArrowDtype):
+            return pc.count_distinct(series.array.__arrow_array__()).as_py()
+        return series.nunique()
+    
+    def _shrink_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Reduce memoria: texto de baja cardinalidad a category y enteros al tipo mínimo"""
+        if df.empty:
+            return df
+        
+        row_count = len(df)
+        for col in df.columns:
+            if col in self.SHRINK_SKIP_COLUMNS:
+                continue
+            
+            series = df[col]
+            if pd.api.types.infer_dtype(series, skipna=True) == 'string':
+                if series.nunique() / row_count < 0.5:
+                    df[col] = series.astype('category')
+            elif pd.api.types.is_integer_dtype(series):
+                df[col] = pd.to_numeric(series, downcast='integer')
+        
+        return df
+    
     def test_connection(self) -> bool:
         """Prueba la conexión a la base de datos."""
         connection = None
@@ -85,24 +427,32 @@ class DatabaseHandler:
             if connection:
                 connection.close()
 
-    def get_all_products(self) -> pd.DataFrame:
-        """Obtiene todos los productos de la tabla con validación automática"""
+    def get_all_products(self, validate_in_sql: bool = True, diagnostics: bool = True) -> pd.DataFrame:
+        """
+        Obtiene todos los productos de la tabla con validación automática
+        Con validate_in_sql, el descarte de encabezados y campos vacíos se hace en
+        la consulta y DataValidator solo deduplica, tipa y reporta anomalías.
+        Con diagnostics=False se omiten la detección de anomalías y el puntaje de calidad.
+        """
         connection = None
         try:
             connection = self.get_connection()
-            # Query simplificado - obtener todos los datos y validar en Python
+            validator = DataValidator()
+            if validate_in_sql:
+                where_clause = validator.get_sql_filter()
+            else:
+                where_clause = ("SKU IS NOT NULL AND SKU != '' "
+                                "AND Descripción IS NOT NULL AND Descripción != ''")
+            
             query = f"""
             SELECT * FROM {self.config['table']}
-            WHERE SKU IS NOT NULL 
-            AND SKU != ''
-            AND Descripción IS NOT NULL 
-            AND Descripción != ''
+            WHERE {where_clause}
             ORDER BY SKU
             LIMIT 3000
             """
             
             self.logger.info(f"get_all_products: Ejecutando query para obtener datos brutos")
-            df_raw = pd.read_sql(query, connection)
+            df_raw = self._read_sql_fast(query, connection)
             
             if df_raw.empty:
                 self.logger.warning("get_all_products: No se obtuvieron datos de la base de datos")
@@ -111,38 +461,16 @@ class DatabaseHandler:
             self.logger.info(f"get_all_products: Obtenidos {len(df_raw)} registros brutos de la BD")
             
             # Aplicar validación automática con DataValidator
-            validator = DataValidator()
-            df_clean, validation_report = validator.validate_dataframe(df_raw)
-            
-            # Log del reporte de validación
-            self.logger.info(f"get_all_products: Validación completada")
-            self.logger.info(f"  - Filas originales: {validation_report['stats']['original_rows']}")
-            self.logger.info(f"  - Filas finales: {validation_report['stats']['final_rows']}")
-            self.logger.info(f"  - Filas removidas: {validation_report['stats']['removed_rows']}")
-            self.logger.info(f"  - Porcentaje removido: {validation_report['stats']['removal_percentage']:.1f}%")
-            self.logger.info(f"  - Puntaje de calidad: {validation_report['data_quality_score']:.1f}/100")
-            
-            # Log de problemas encontrados
-            if validation_report['issues']:
-                self.logger.info("get_all_products: Problemas detectados y corregidos:")
-                for issue in validation_report['issues']:
-                    self.logger.info(f"  - {issue['type']}: {issue['description']} ({issue['count']} casos)")
+            df_clean, validation_report = validator.validate_dataframe(
+                df_raw, sql_prefiltered=validate_in_sql, diagnostics=diagnostics)
             
-            # Log de muestra de datos finales
-            if not df_clean.empty:
-                first_row = df_clean.iloc[0]
-                last_row = df_clean.iloc[-1]
-                self.logger.info(f"Primera fila válida - SKU: '{first_row.get('SKU')}', Descripción: '{first_row.get('Descripción')}'")
-                self.logger.info(f"Última fila válida - SKU: '{last_row.get('SKU')}', Descripción: '{last_row.get('Descripción')}'")
-                
-                # Verificar diversidad de datos
-                unique_skus = df_clean['SKU'].nunique()
-                unique_descriptions = df_clean['Descripción'].nunique()
-                self.logger.info(f"Diversidad de datos - SKUs únicos: {unique_skus}, Descripciones únicas: {unique_descriptions}")
-            else:
+            if df_clean.empty:
                 self.logger.warning("¡No se encontraron registros válidos después de la validación!")
+            elif self.logger.isEnabledFor(logging.INFO):
+                # El reporte (muestras y conteos de únicos) solo se calcula si se va a registrar
+                self._log_validation_report(df_clean, validation_report)
             
-            return df_clean
+            return self._shrink_dataframe(df_clean)
             
         except Exception as e:
             self.logger.error(f"get_all_products: Error obteniendo productos: {e}")
@@ -153,119 +481,89 @@ class DatabaseHandler:
             if connection:
                 connection.close()
     
+    def _log_validation_report(self, df_clean: pd.DataFrame, validation_report: Dict[str, Any]):
+        """Registra el reporte de validación de get_all_products y una muestra de los datos"""
+        stats = validation_report['stats']
+        self.logger.info(f"get_all_products: Validación completada")
+        self.logger.info(f"  - Filas originales: {stats['original_rows']}")
+        self.logger.info(f"  - Filas finales: {stats['final_rows']}")
+        self.logger.info(f"  - Filas removidas: {stats['removed_rows']}")
+        self.logger.info(f"  - Porcentaje removido: {stats['removal_percentage']:.1f}%")
+        if validation_report['data_quality_score'] is not None:
+            self.logger.info(f"  - Puntaje de calidad: {validation_report['data_quality_score']:.1f}/100")
+        
+        # Log de problemas encontrados
+        if validation_report['issues']:
+            self.logger.info("get_all_products: Problemas detectados y corregidos:")
+            for issue in validation_report['issues']:
+                self.logger.info(f"  - {issue['type']}: {issue['description']} ({issue['count']} casos)")
+        
+        # Log de muestra de datos finales (solo las dos columnas, sin armar la fila completa)
+        sku, descripcion = df_clean['SKU'], df_clean['Descripción']
+        self.logger.info(f"Primera fila válida - SKU: '{sku.iat[0]}', Descripción: '{descripcion.iat[0]}'")
+        self.logger.info(f"Última fila válida - SKU: '{sku.iat[-1]}', Descripción: '{descripcion.iat[-1]}'")
+        
+        # Verificar diversidad de datos
+        unique_skus = self._count_unique(sku)
+        unique_descriptions = self._count_unique(descripcion)
+        self.logger.info(f"Diversidad de datos - SKUs únicos: {unique_skus}, Descripciones únicas: {unique_descriptions}")
+    
+    def iter_all_products(self, chunk_rows: int = 50_000) -> Iterator[pd.DataFrame]:
+        """
+        Itera la tabla completa en bloques de chunk_rows filas (sin validar)
+        Pensado para DataValidator.validate_iter en tablas grandes.
+        """
+        connection = self.get_connection()
+        try:
+            query = f"""
+            SELECT * FROM {self.config['table']}
+            WHERE SKU IS NOT NULL 
+            AND SKU != ''
+            AND Descripción IS NOT NULL 
+            AND Descripción != ''
+            ORDER BY SKU
+            """
+            # pd.read_sql con chunksize trae igualmente todo el resultado al cliente
+            # con el cursor por defecto; SSCursor lo lee bloque a bloque
+            yield from self._iter_sql_blocks(query, connection, block_rows=chunk_rows)
+        finally:
+            connection.close()
+    
     def get_products_filtered(self, filters: Dict[str, Any]) -> pd.DataFrame:
         """Obtiene productos con filtros aplicados"""
         connection = None
+        base_query = ""
+        params = []
         try:
             connection = self.get_connection()
-            # Base query con filtros para excluir filas inválidas
-            base_query = f"""SELECT * FROM {self.config['table']} WHERE 1=1 """
-            params = []
             self.logger.info(f"get_products_filtered: Filtros recibidos: {filters}")
             
-            # Construir query con filtros
-            if filters.get('familia'):
-                base_query += " AND Familia = %s"
-                params.append(filters['familia'])
-            
-            if filters.get('marca'):
-                base_query += " AND Marca = %s"
-                params.append(filters['marca'])
-            
-            # Filtros de stock mejorados
-            if filters.get('stock_min') is not None:
-                base_query += " AND CAST(Stock AS SIGNED) >= %s"
-                params.append(filters['stock_min'])
-
-            if filters.get('stock_max') is not None:
-                base_query += " AND CAST(Stock AS SIGNED) <= %s"
-                params.append(filters['stock_max'])
-            
-            # Filtros especiales de stock
-            if filters.get('stock_disponible'):
-                base_query += " AND (Stock = 'Disponible' OR CAST(Stock AS SIGNED) > 0)"
-            
-            if filters.get('stock_consultar'):
-                base_query += " AND Stock = 'Consultar'"
-            
-            # Filtros de precio
-            if filters.get('precio_min') is not None:
-                base_query += " AND CAST(Precio_USD_con_IVA AS DECIMAL(10,2)) >= %s"
-                params.append(filters['precio_min'])
+            # La forma del filtro (qué claves están presentes) determina la plantilla SQL;
+            # los valores viajan siempre como parámetros
+            shape, params = _filter_shape_and_params(filters)
             
-            if filters.get('precio_max') is not None:
-                base_query += " AND CAST(Precio_USD_con_IVA AS DECIMAL(10,2)) <= %s"
-                params.append(filters['precio_max'])
-            
-            # Filtros de potencia
-            if filters.get('potencia_min') is not None:
-                base_query += " AND CAST(REGEXP_REPLACE(Potencia, '[^0-9.]', '') AS DECIMAL(10,2)) >= %s"
-                params.append(filters['potencia_min'])
-            
-            if filters.get('potencia_max') is not None:
-                base_query += " AND CAST(REGEXP_REPLACE(Potencia, '[^0-9.]', '') AS DECIMAL(10,2)) <= %s"
-                params.append(filters['potencia_max'])
-            
-            # Filtro de combustible
-            if filters.get('combustible'):
-                base_query += " AND Combustible LIKE %s"
-                params.append(f"%{filters['combustible']}%")
-            
-            # Filtros de cabina y TTA
-            if filters.get('has_cabina') is not None:
-                if filters['has_cabina']:
-                    base_query += " AND (Cabina IS NOT NULL AND Cabina != '' AND Cabina != 'Sin Cabina')"
-                else:
-                    base_query += " AND (Cabina IS NULL OR Cabina = '' OR Cabina = 'Sin Cabina')"
-            
-            if filters.get('has_tta') is not None:
-                if filters['has_tta']:
-                    base_query += " AND (TTA_Incluido = 'Sí' OR TTA_Incluido = 'Si' OR TTA_Incluido = '1')"
-                else:
-                    base_query += " AND (TTA_Incluido = 'No' OR TTA_Incluido = '0' OR TTA_Incluido IS NULL)"
-            
-            # Búsqueda de texto
-            if filters.get('search_text'):
-                search = f"%{filters['search_text']}%"
-                base_query += " AND (SKU LIKE %s OR Descripción LIKE %s OR Modelo LIKE %s OR Marca LIKE %s)"
-                params.extend([search, search, search, search])
-            
-            # Ordenamiento
+            # Ordenamiento (solo columnas/direcciones de la lista blanca)
             order_by = filters.get('order_by', 'SKU')
-            order_dir = filters.get('order_dir', 'ASC')
-            
-            # Validar columna de ordenamiento
-            valid_columns = ['SKU', 'Descripción', 'Marca', 'Familia', 'Stock', 'Precio_USD_con_IVA', 'Potencia']
-            if order_by in valid_columns:
-                base_query += f" ORDER BY {order_by} {order_dir}"
-            else:
-                base_query += " ORDER BY SKU ASC"
+            order_dir = str(filters.get('order_dir', 'ASC')).upper()
+            if order_by not in ORDER_COLUMNS:
+                order_by, order_dir = 'SKU', 'ASC'
+            elif order_dir not in ORDER_DIRECTIONS:
+                order_dir = 'ASC'
             
             # Límite
-            if filters.get('limit') and isinstance(filters['limit'], int) and filters['limit'] > 0:
-                base_query += f" LIMIT {filters['limit']}"
+            has_limit = bool(filters.get('limit') and isinstance(filters['limit'], int) and filters['limit'] > 0)
+            if has_limit:
+                params.append(filters['limit'])
+            
+            base_query = _build_filtered_query(self.config['table'], shape, order_by, order_dir, has_limit,
+                                               bool(self.config.get('use_generated_columns')))
             
             self.logger.info(f"Ejecutando query: {base_query}")
             self.logger.info(f"Parámetros: {params}")
-            df = pd.read_sql(base_query, connection, params=params)
-            
-            # Aplicar el mismo filtro que en get_all_products
-            if not df.empty:
-                # Remover filas donde SKU sea igual al nombre de la columna
-                df = df[df['SKU'] != 'SKU']
-                
-                # Remover cualquier fila donde múltiples campos sean iguales a sus nombres de columna
-                mask = True
-                for col in ['SKU', 'Descripción', 'Marca', 'Familia']:
-                    if col in df.columns:
-                        mask &= (df[col] != col)
-                df = df[mask]
-                
-                # Reset index después del filtrado
-                df = df.reset_index(drop=True)
+            df = self._read_sql_fast(base_query, connection, params)
             
             self.logger.info(f"Filtrados {len(df)} productos (después de filtrar datos inválidos)")
-            return df
+            return self._shrink_dataframe(df)
         except Exception as e:
             self.logger.error(f"Error en consulta filtrada: {e}")
             self.logger.error(f"Query: {base_query}")
@@ -274,135 +572,107 @@ class DatabaseHandler:
         finally:
             if connection:
                 connection.close()
-        params = []
-        self.logger.info(f"get_products_filtered: Filtros recibidos: {filters}")
-        
-        # Construir query con filtros
-        if filters.get('familia'):
-            base_query += " AND Familia = %s"
-            params.append(filters['familia'])
-        
-        if filters.get('marca'):
-            base_query += " AND Marca = %s"
-            params.append(filters['marca'])
-        
-        # Filtros de stock mejorados
-        if filters.get('stock_min') is not None:
-            base_query += " AND CAST(Stock AS SIGNED) >= %s"
-            params.append(filters['stock_min'])
-
-        if filters.get('stock_max') is not None:
-            base_query += " AND CAST(Stock AS SIGNED) <= %s"
-            params.append(filters['stock_max'])
-        
-        # Filtros especiales de stock
-        if filters.get('stock_disponible'):
-            base_query += " AND (Stock = 'Disponible' OR CAST(Stock AS SIGNED) > 0)"
-        
-        if filters.get('stock_consultar'):
-            base_query += " AND Stock = 'Consultar'"
-        
-        # Filtros de precio
-        if filters.get('precio_min') is not None:
-            base_query += " AND CAST(Precio_USD_con_IVA AS DECIMAL(10,2)) >= %s"
-            params.append(filters['precio_min'])
-        
-        if filters.get('precio_max') is not None:
-            base_query += " AND CAST(Precio_USD_con_IVA AS DECIMAL(10,2)) <= %s"
-            params.append(filters['precio_max'])
-        
-        # Filtros de potencia
-        if filters.get('potencia_min') is not None:
-            base_query += " AND CAST(REGEXP_REPLACE(Potencia, '[^0-9.]', '') AS DECIMAL(10,2)) >= %s"
-            params.append(filters['potencia_min'])
-        
-        if filters.get('potencia_max') is not None:
-            base_query += " AND CAST(REGEXP_REPLACE(Potencia, '[^0-9.]', '') AS DECIMAL(10,2)) <= %s"
-            params.append(filters['potencia_max'])
-        
-        # Filtro de combustible
-        if filters.get('combustible'):
-            base_query += " AND Combustible LIKE %s"
-            params.append(f"%{filters['combustible']}%")
+
+    def _get_cached_distinct(self, column: str) -> Optional[List[str]]:
+        """Valores únicos en caché de column, o None si no están o vencieron"""
+        entry = self._distinct_cache.get(column)
+        if entry is None or time.monotonic() - entry[0] > self.DISTINCT_CACHE_TTL:
+            return None
+        return list(entry[1])
+    
+    def invalidate_distinct_cache(self, columns: Optional[Iterable[str]] = None):
+        """Descarta los valores únicos en caché (de columns, o todos)"""
+        if columns is None:
+            self._distinct_cache.clear()
+            return
+        for column in columns:
+            self._distinct_cache.pop(column, None)
+    
+    def get_distinct_values(self, column: str) -> List[str]:
+        """Obtiene valores únicos de una columna (en caché DISTINCT_CACHE_TTL segundos)"""
+        if column not in self.DISTINCT_COLUMNS:
+            self.logger.error(f"Columna no permitida para valores únicos: {column}")
+            return []
         
-        # Filtros de cabina y TTA
-        if filters.get('has_cabina') is not None:
-            if filters['has_cabina']:
-                base_query += " AND (Cabina IS NOT NULL AND Cabina != '' AND Cabina != 'Sin Cabina')"
-            else:
-                base_query += " AND (Cabina IS NULL OR Cabina = '' OR Cabina = 'Sin Cabina')"
+        cached = self._get_cached_distinct(column)
+        if cached is not None:
+            return cached
         
-        if filters.get('has_tta') is not None:
-            if filters['has_tta']:
-                base_query += " AND (TTA_Incluido = 'Sí' OR TTA_Incluido = 'Si' OR TTA_Incluido = '1')"
+        connection = None
+        try:
+            connection = self.get_connection()
+            query = f"SELECT DISTINCT {column} FROM {self.config['table']} WHERE {column} IS NOT NULL ORDER BY {column}"
+            with connection.cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute(query)
+                values = [row[0] for row in cursor.fetchall() if row[0]]
+            self._distinct_cache[column] = (time.monotonic(), values)
+            return list(values)
+        except Exception as e:
+            self.logger.error(f"Error obteniendo valores únicos de {column}: {e}")
+            return []
+        finally:
+            if connection:
+                connection.close()
+
+    def get_distinct_values_multi(self, columns: List[str]) -> Dict[str, List[str]]:
+        """
+        Obtiene valores únicos de varias columnas en una sola consulta (UNION ALL)
+        Solo se consultan las columnas que no están en caché.
+        """
+        result = {column: [] for column in columns}
+        missing = []
+        for column in columns:
+            if column not in self.DISTINCT_COLUMNS:
+                self.logger.error(f"Columna no permitida para valores únicos: {column}")
+                continue
+            cached = self._get_cached_distinct(column)
+            if cached is None:
+                missing.append(column)
             else:
-                base_query += " AND (TTA_Incluido = 'No' OR TTA_Incluido = '0' OR TTA_Incluido IS NULL)"
-        
-        # Búsqueda de texto
-        if filters.get('search_text'):
-            search = f"%{filters['search_text']}%"
-            base_query += " AND (SKU LIKE %s OR Descripción LIKE %s OR Modelo LIKE %s OR Marca LIKE %s)"
-            params.extend([search, search, search, search])
-        
-        # Ordenamiento
-        order_by = filters.get('order_by', 'SKU')
-        order_dir = filters.get('order_dir', 'ASC')
-        
-        # Validar columna de ordenamiento
-        valid_columns = ['SKU', 'Descripción', 'Marca', 'Familia', 'Stock', 'Precio_USD_con_IVA', 'Potencia']
-        if order_by in valid_columns:
-            base_query += f" ORDER BY {order_by} {order_dir}"
-        else:
-            base_query += " ORDER BY SKU ASC"
-        
-        # Límite
-        if filters.get('limit') and isinstance(filters['limit'], int) and filters['limit'] > 0:
-            base_query += f" LIMIT {filters['limit']}"
+                result[column] = cached
+        if not missing:
+            return result
         
+        connection = None
         try:
-            self.logger.info(f"Ejecutando query: {base_query}")
-            self.logger.info(f"Parámetros: {params}")
-            df = pd.read_sql(base_query, connection, params=params)
-            
-            # Aplicar el mismo filtro que en get_all_products
-            if not df.empty:
-                # Remover filas donde SKU sea igual al nombre de la columna
-                df = df[df['SKU'] != 'SKU']
-                
-                # Remover cualquier fila donde múltiples campos sean iguales a sus nombres de columna
-                mask = True
-                for col in ['SKU', 'Descripción', 'Marca', 'Familia']:
-                    if col in df.columns:
-                        mask &= (df[col] != col)
-                df = df[mask]
-                
-                # Reset index después del filtrado
-                df = df.reset_index(drop=True)
-            
-            self.logger.info(f"Filtrados {len(df)} productos (después de filtrar datos inválidos)")
-            return df
+            connection = self.get_connection()
+            query = " UNION ALL ".join(
+                f"SELECT %s AS col, {column} AS val FROM {self.config['table']} "
+                f"WHERE {column} IS NOT NULL GROUP BY {column}"
+                for column in missing
+            ) + " ORDER BY col, val"
+            with connection.cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute(query, missing)
+                for column, value in cursor.fetchall():
+                    if value:
+                        result[column].append(value)
+            now = time.monotonic()
+            for column in missing:
+                self._distinct_cache[column] = (now, list(result[column]))
+            return result
         except Exception as e:
-            self.logger.error(f"Error en consulta filtrada: {e}")
-            self.logger.error(f"Query: {base_query}")
-            self.logger.error(f"Params: {params}")
-            return pd.DataFrame()
+            self.logger.error(f"Error obteniendo valores únicos de {columns}: {e}")
+            return {column: [] for column in columns}
         finally:
             if connection:
                 connection.close()
 
-    def get_distinct_values(self, column: str) -> List[str]:
-        """Obtiene valores únicos de una columna"""
+    def count_distinct(self, column: str) -> int:
+        """Cuenta valores únicos (no vacíos) de una columna sin transferirlos"""
+        if column not in self.DISTINCT_COLUMNS:
+            self.logger.error(f"Columna no permitida para valores únicos: {column}")
+            return 0
+        
         connection = None
         try:
             connection = self.get_connection()
-            query = f"SELECT DISTINCT {column} FROM {self.config['table']} WHERE {column} IS NOT NULL ORDER BY {column}"
-            with connection.cursor() as cursor:
+            query = f"SELECT COUNT(DISTINCT NULLIF({column}, '')) FROM {self.config['table']}"
+            with connection.cursor(pymysql.cursors.Cursor) as cursor:
                 cursor.execute(query)
-                results = cursor.fetchall()
-                return [row[column] for row in results if row[column]]
+                return int(cursor.fetchone()[0] or 0)
         except Exception as e:
-            self.logger.error(f"Error obteniendo valores únicos de {column}: {e}")
-            return []
+            self.logger.error(f"Error contando valores únicos de {column}: {e}")
+            return 0
         finally:
             if connection:
                 connection.close()
@@ -415,10 +685,17 @@ class DatabaseHandler:
         connection = None
         try:
             connection = self.get_connection()
-            placeholders = ', '.join(['%s'] * len(ids))
-            query = f"SELECT * FROM {self.config['table']} WHERE SKU IN ({placeholders})"
-            df = pd.read_sql(query, connection, params=ids)
-            return df
+            if len(ids) >= self.IDS_TEMP_TABLE_THRESHOLD:
+                return self._shrink_dataframe(self._read_products_by_id_table(connection, ids))
+            
+            # Rellenar hasta la siguiente potencia de dos repitiendo el último SKU:
+            # pocas plantillas distintas (en caché aquí y en el servidor) y mismo resultado
+            params = list(ids)
+            padded = 1 << (len(params) - 1).bit_length()
+            params.extend([params[-1]] * (padded - len(params)))
+            query = _build_ids_query(self.config['table'], padded)
+            df = self._read_sql_fast(query, connection, params)
+            return self._shrink_dataframe(df)
         except Exception as e:
             self.logger.error(f"Error obteniendo productos por IDs: {e}")
             return pd.DataFrame()
@@ -426,6 +703,58 @@ class DatabaseHandler:
             if connection:
                 connection.close()
 
+    def _read_products_by_id_table(self, connection, ids: List[str]) -> pd.DataFrame:
+        """
+        Lee productos cargando los SKUs en una tabla temporal y haciendo JOIN
+        Evita listas IN enormes. Las conexiones del pool conservan su sesión (y sus
+        tablas temporales) al devolverse, así que el DROP explícito del finally es
+        lo único que borra la tabla: no quitarlo.
+        """
+        table = self.config['table']
+        with connection.cursor() as cursor:
+            # Copiar el tipo y la collation de SKU evita mezclas de collation en el JOIN
+            cursor.execute(f"CREATE TEMPORARY TABLE _ids_lookup SELECT SKU FROM {table} LIMIT 0")
+        try:
+            with connection.cursor() as cursor:
+                # pymysql agrupa executemany de INSERT en sentencias multi-fila
+                cursor.executemany("INSERT INTO _ids_lookup (SKU) VALUES (%s)",
+                                   [(sku,) for sku in dict.fromkeys(ids)])
+            # Sin connectorx: la tabla temporal solo existe en esta conexión
+            return self._read_sql_streaming(
+                f"SELECT p.* FROM {table} p JOIN _ids_lookup USING (SKU)", connection)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TEMPORARY TABLE IF EXISTS _ids_lookup")
+
+    def create_filter_columns(self) -> bool:
+        """
+        Agrega a la tabla las columnas generadas de _GENERATED_COLUMNS con su índice
+        Migración única; después activar 'use_generated_columns' en la configuración.
+        """
+        connection = None
+        try:
+            connection = self.get_connection()
+            table = self.config['table']
+            with connection.cursor() as cursor:
+                cursor.execute(f"SHOW COLUMNS FROM {table}")
+                existing = {row[0] for row in cursor.fetchall()}
+                for name, (sql_type, expression) in _GENERATED_COLUMNS.items():
+                    if name in existing:
+                        continue
+                    cursor.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {name} {sql_type} "
+                        f"GENERATED ALWAYS AS ({expression}) STORED INVISIBLE, "
+                        f"ADD INDEX idx_{name} ({name})"
+                    )
+                    self.logger.info(f"Columna generada {name} agregada a {table}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error creando columnas generadas: {e}")
+            return False
+        finally:
+            if connection:
+                connection.close()
+
     def get_statistics(self) -> Dict[str, Any]:
         """Obtiene estadísticas de la base de datos"""
         connection = None
@@ -441,32 +770,26 @@ class DatabaseHandler:
         
         try:
             connection = self.get_connection()
-            # Total de productos
-            query = f"SELECT COUNT(*) as count FROM {self.config['table']}"
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                stats['total_products'] = cursor.fetchone()['count']
-            
-            # Familias únicas
-            stats['total_families'] = len(self.get_distinct_values('Familia'))
-            
-            # Marcas únicas
-            stats['total_brands'] = len(self.get_distinct_values('Marca'))
-            
-            # Productos con/sin stock
-            query = f"SELECT COUNT(*) as count FROM {self.config['table']} WHERE Stock > 0"
-            with connection.cursor() as cursor:
+            # Todas las métricas en una sola consulta agregada (un único round-trip)
+            query = f"""
+            SELECT
+                COUNT(*) AS total,
+                COUNT(DISTINCT NULLIF(Familia, '')) AS n_familias,
+                COUNT(DISTINCT NULLIF(Marca, '')) AS n_marcas,
+                SUM(Stock > 0) AS with_stock,
+                AVG(CASE WHEN Precio_USD_con_IVA > 0 THEN Precio_USD_con_IVA END) AS avg_price
+            FROM {self.config['table']}
+            """
+            with connection.cursor(pymysql.cursors.Cursor) as cursor:
                 cursor.execute(query)
-                stats['products_with_stock'] = cursor.fetchone()['count']
+                total, n_familias, n_marcas, with_stock, avg_price = cursor.fetchone()
             
+            stats['total_products'] = int(total or 0)
+            stats['total_families'] = int(n_familias or 0)
+            stats['total_brands'] = int(n_marcas or 0)
+            stats['products_with_stock'] = int(with_stock or 0)
             stats['products_without_stock'] = stats['total_products'] - stats['products_with_stock']
-            
-            # Precio promedio
-            query = f"SELECT AVG(Precio_USD_con_IVA) as avg_price FROM {self.config['table']} WHERE Precio_USD_con_IVA > 0"
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                result = cursor.fetchone()
-                stats['average_price'] = round(result['avg_price'], 2) if result['avg_price'] else 0
+            stats['average_price'] = round(float(avg_price), 2) if avg_price else 0
             
             stats['last_update'] = datetime.now().isoformat()
             
@@ -480,13 +803,18 @@ class DatabaseHandler:
     
     def update_product_field(self, sku: str, field: str, value: Any) -> bool:
         """Actualiza un campo específico de un producto"""
+        if field not in self.UPDATABLE_FIELDS:
+            self.logger.error(f"Campo no permitido en actualización: {field}")
+            return False
+        
         connection = None
         try:
             connection = self.get_connection()
-            query = f"UPDATE {self.config['table']} SET {field} = %s WHERE SKU = %s"
+            query = _build_update_query(self.config['table'], field)
             with connection.cursor() as cursor:
                 cursor.execute(query, (value, sku))
                 connection.commit()
+                self.invalidate_distinct_cache([field])
                 return cursor.rowcount > 0
         except Exception as e:
             self.logger.error(f"Error actualizando producto {sku}: {e}")
@@ -498,26 +826,43 @@ class DatabaseHandler:
                 connection.close()
 
     def bulk_update_field(self, updates: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Actualiza múltiples productos en lote"""
+        """Actualiza múltiples productos en lote (un UPDATE ... CASE por campo y lote)"""
         connection = None
         results = {'success': 0, 'failed': 0}
         
+        # Agrupar por campo: cada lote del grupo es una única sentencia
+        groups = defaultdict(list)
+        for update in updates:
+            groups[update['field']].append((update['sku'], update['value']))
+        
         try:
             connection = self.get_connection()
             with connection.cursor() as cursor:
-                for update in updates:
-                    try:
-                        query = f"UPDATE {self.config['table']} SET {update['field']} = %s WHERE SKU = %s"
-                        cursor.execute(query, (update['value'], update['sku']))
-                        if cursor.rowcount > 0:
-                            results['success'] += 1
-                        else:
-                            results['failed'] += 1
-                    except Exception as e:
-                        self.logger.error(f"Error en update de {update['sku']}: {e}")
-                        results['failed'] += 1
+                for field, rows in groups.items():
+                    if field not in self.UPDATABLE_FIELDS:
+                        self.logger.error(f"Campo no permitido en actualización masiva: {field}")
+                        results['failed'] += len(rows)
+                        continue
+                    
+                    for start in range(0, len(rows), self.BULK_BATCH_SIZE):
+                        batch = rows[start:start + self.BULK_BATCH_SIZE]
+                        # pymysql.executemany solo agrupa INSERT/REPLACE; un UPDATE por fila
+                        # serían len(batch) round-trips. Si un SKU se repite, gana el último valor.
+                        values = dict(batch)
+                        query = _build_case_update(self.config['table'], field, len(values))
+                        params = [item for pair in values.items() for item in pair]
+                        params.extend(values)
+                        try:
+                            cursor.execute(query, params)
+                            updated = min(max(cursor.rowcount, 0), len(batch))
+                            results['success'] += updated
+                            results['failed'] += len(batch) - updated
+                        except Exception as e:
+                            self.logger.error(f"Error en update de {field} ({len(batch)} filas): {e}")
+                            results['failed'] += len(batch)
                 
                 connection.commit()
+                self.invalidate_distinct_cache(groups)
         except Exception as e:
             self.logger.error(f"Error en actualización masiva: {e}")
             if connection:
@@ -537,17 +882,22 @@ class DatabaseHandler:
             filepath = Path("exports") / filename
             filepath.parent.mkdir(exist_ok=True)
             
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+            engine = 'xlsxwriter' if _XLSXWRITER else 'openpyxl'
+            with pd.ExcelWriter(filepath, engine=engine) as writer:
                 df.to_excel(writer, index=False, sheet_name='Productos')
                 
                 # Ajustar anchos de columna
                 worksheet = writer.sheets['Productos']
-                for idx, col in enumerate(df.columns):
-                    max_length = max(
-                        df[col].astype(str).apply(len).max(),
-                        len(col)
-                    ) + 2
-                    worksheet.column_dimensions[chr(65 + idx)].width = min(max_length, 50)
+                widths = {
+                    col: min(max(df[col].astype(str).str.len().max() if len(df) else 0, len(col)) + 2, 50)
+                    for col in df.columns
+                }
+                for idx, (col, width) in enumerate(widths.items()):
+                    if _XLSXWRITER:
+                        worksheet.set_column(idx, idx, width)
+                    else:
+                        # get_column_letter sigue con AA, AB... pasada la Z (chr(65 + idx) no)
+                        worksheet.column_dimensions[get_column_letter(idx + 1)].width = width
             
             self.logger.info(f"Exportado a {filepath}")
             return str(filepath)
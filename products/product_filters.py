@@ -4,9 +4,28 @@ Maneja la lógica de filtrado y búsqueda avanzada
 """
 
 from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, replace
+from functools import lru_cache
+from types import MappingProxyType
 import re
 
+# Operadores de parse_search_query, compilados una sola vez
+_SEARCH_PATTERNS = (
+    ('familia', re.compile(r'familia:(\S+)', re.IGNORECASE)),
+    ('marca', re.compile(r'marca:(\S+)', re.IGNORECASE)),
+    ('stock', re.compile(r'stock:([><=]+)(\d+)', re.IGNORECASE)),
+    ('precio', re.compile(r'precio:([><=]+)(\d+)', re.IGNORECASE)),
+    ('potencia', re.compile(r'potencia:([><=]+)(\d+)', re.IGNORECASE)),
+    ('cabina', re.compile(r'cabina:(si|no|true|false)', re.IGNORECASE)),
+    ('tta', re.compile(r'tta:(si|no|true|false)', re.IGNORECASE)),
+)
+
+# Todos los operadores en una alternancia con un grupo nombrado por clave (un solo recorrido)
+_QUERY_RE = re.compile(
+    '|'.join(f'(?P<{key}>{pattern.pattern})' for key, pattern in _SEARCH_PATTERNS),
+    re.IGNORECASE
+)
+
 @dataclass
 class FilterCriteria:
     """Criterios de filtrado para productos"""
@@ -28,6 +47,77 @@ class FilterCriteria:
     limit: Optional[int] = None
     selected_only: bool = False
     selected_skus: List[str] = field(default_factory=list)
+    
+    def is_default(self) -> bool:
+        """True si todos los campos tienen su valor por defecto (sin filtro)"""
+        return self == _DEFAULT_CRITERIA
+
+def _is_set(value: Any) -> bool:
+    """True si el valor fue indicado (distinto de None)"""
+    return value is not None
+
+# Campos que apply_filter copia tal cual y cuándo: texto si no está vacío, números y
+# booleanos si no son None (0 y False son filtros válidos)
+_FILTER_RULES = (
+    ('familia', bool),
+    ('marca', bool),
+    ('stock_min', _is_set),
+    ('stock_max', _is_set),
+    ('precio_min', _is_set),
+    ('precio_max', _is_set),
+    ('search_text', bool),
+    ('has_cabina', _is_set),
+    ('has_tta', _is_set),
+    ('combustible', bool),
+    ('potencia_min', _is_set),
+    ('potencia_max', _is_set),
+)
+
+# Valores del filtro 'stock' del frontend -> (clave, valor) en el diccionario de consulta
+_STOCK_OPTIONS = {
+    'con_stock': ('stock_min', 1),
+    'sin_stock': ('stock_max', 0),
+    'disponible': ('stock_disponible', True),
+    'consultar': ('stock_consultar', True),
+}
+
+# Criterio sin filtros, compartido por is_default
+_DEFAULT_CRITERIA = FilterCriteria()
+
+# Filtros predefinidos: se construyen una vez al importar y se exponen de solo lectura
+_PRESETS_VIEW = MappingProxyType({
+    'en_stock': FilterCriteria(
+        stock_min=1,
+        order_by='Stock',
+        order_dir='DESC'
+    ),
+    'sin_stock': FilterCriteria(
+        stock_max=0,
+        order_by='SKU'
+    ),
+    'generadores_diesel': FilterCriteria(
+        familia='Grupos Electrógenos',
+        combustible='diesel'
+    ),
+    'alta_potencia': FilterCriteria(
+        potencia_min=100,
+        order_by='Potencia',
+        order_dir='DESC'
+    ),
+    'precio_bajo': FilterCriteria(
+        precio_max=5000,
+        order_by='Precio_USD_con_IVA',
+        order_dir='ASC'
+    ),
+    'con_cabina': FilterCriteria(
+        has_cabina=True
+    ),
+    'recientes': FilterCriteria(
+        order_by='fecha_actualizacion',
+        order_dir='DESC',
+        limit=100
+    )
+})
 
 class ProductFilters:
     """Gestiona los filtros de productos"""
@@ -35,96 +125,29 @@ class ProductFilters:
     def __init__(self):
         self.current_filter = FilterCriteria()
         self.saved_filters = {}
-        self.filter_presets = self._load_presets()
-    
-    def _load_presets(self) -> Dict[str, FilterCriteria]:
-        """Carga filtros predefinidos"""
-        return {
-            'en_stock': FilterCriteria(
-                stock_min=1,
-                order_by='Stock',
-                order_dir='DESC'
-            ),
-            'sin_stock': FilterCriteria(
-                stock_max=0,
-                order_by='SKU'
-            ),
-            'generadores_diesel': FilterCriteria(
-                familia='Grupos Electrógenos',
-                combustible='diesel'
-            ),
-            'alta_potencia': FilterCriteria(
-                potencia_min=100,
-                order_by='Potencia',
-                order_dir='DESC'
-            ),
-            'precio_bajo': FilterCriteria(
-                precio_max=5000,
-                order_by='Precio_USD_con_IVA',
-                order_dir='ASC'
-            ),
-            'con_cabina': FilterCriteria(
-                has_cabina=True
-            ),
-            'recientes': FilterCriteria(
-                order_by='fecha_actualizacion',
-                order_dir='DESC',
-                limit=100
-            )
-        }
+        self.filter_presets = _PRESETS_VIEW
     
     def apply_filter(self, criteria: FilterCriteria) -> Dict[str, Any]:
-        """Convierte FilterCriteria a diccionario para consulta SQL"""
+        """Convierte FilterCriteria a diccionario para consulta SQL (memoizado por valor)"""
+        key = _criteria_key(criteria)
+        if key is None:
+            return self._build_filter_dict(criteria)
+        return dict(_cached_filter_dict(key))
+    
+    @staticmethod
+    def _build_filter_dict(criteria: FilterCriteria) -> Dict[str, Any]:
+        """Construye el diccionario de apply_filter"""
         filter_dict = {}
         
-        # Filtros básicos
-        if criteria.familia:
-            filter_dict['familia'] = criteria.familia
-        
-        if criteria.marca:
-            filter_dict['marca'] = criteria.marca
-        
-        if criteria.stock_min is not None:
-            filter_dict['stock_min'] = criteria.stock_min
-        
-        if criteria.stock_max is not None:
-            filter_dict['stock_max'] = criteria.stock_max
-        
-        # Manejo del filtro 'stock' del frontend
-        if criteria.stock:
-            if criteria.stock == 'con_stock':
-                filter_dict['stock_min'] = 1
-            elif criteria.stock == 'sin_stock':
-                filter_dict['stock_max'] = 0
-            elif criteria.stock == 'disponible':
-                filter_dict['stock_disponible'] = True
-            elif criteria.stock == 'consultar':
-                filter_dict['stock_consultar'] = True
-        
-        if criteria.precio_min is not None:
-            filter_dict['precio_min'] = criteria.precio_min
-        
-        if criteria.precio_max is not None:
-            filter_dict['precio_max'] = criteria.precio_max
-        
-        if criteria.search_text:
-            filter_dict['search_text'] = criteria.search_text
-        
-        # Filtros avanzados (requieren procesamiento adicional)
-        if criteria.has_cabina is not None:
-            filter_dict['has_cabina'] = criteria.has_cabina
-        
-        if criteria.has_tta is not None:
-            filter_dict['has_tta'] = criteria.has_tta
-        
-        if criteria.combustible:
-            filter_dict['combustible'] = criteria.combustible
+        for name, include in _FILTER_RULES:
+            value = getattr(criteria, name)
+            if include(value):
+                filter_dict[name] = value
         
-        if criteria.potencia_min is not None:
-            filter_dict['potencia_min'] = criteria.potencia_min
-        
-        if criteria.potencia_max is not None:
-            filter_dict['potencia_max'] = criteria.potencia_max
+        # Manejo del filtro 'stock' del frontend (pisa stock_min/stock_max)
+        if criteria.stock in _STOCK_OPTIONS:
+            key, value = _STOCK_OPTIONS[criteria.stock]
+            filter_dict[key] = value
         
         # Ordenamiento y límite
         filter_dict['order_by'] = criteria.order_by
@@ -139,20 +162,20 @@ class ProductFilters:
         """Parsea una búsqueda avanzada con operadores"""
         filters = {}
         
-        # Patrones de búsqueda
-        patterns = {
-            'familia': r'familia:(\S+)',
-            'marca': r'marca:(\S+)',
-            'stock': r'stock:([><=]+)(\d+)',
-            'precio': r'precio:([><=]+)(\d+)',
-            'potencia': r'potencia:([><=]+)(\d+)',
-            'cabina': r'cabina:(si|no|true|false)',
-            'tta': r'tta:(si|no|true|false)'
-        }
+        # Un recorrido: primera aparición de cada operador y tramos de texto entre operadores
+        first_matches = {}
+        text_parts = []
+        last_end = 0
+        for match in _QUERY_RE.finditer(query):
+            first_matches.setdefault(match.lastgroup, match.group(match.lastgroup))
+            text_parts.append(query[last_end:match.start()])
+            last_end = match.end()
+        text_parts.append(query[last_end:])
         
-        for key, pattern in patterns.items():
-            match = re.search(pattern, query, re.IGNORECASE)
-            if match:
+        for key, pattern in _SEARCH_PATTERNS:
+            token = first_matches.get(key)
+            if token is not None:
+                match = pattern.match(token)
                 if key in ['stock', 'precio', 'potencia']:
                     operator = match.group(1)
                     value = int(match.group(2))
@@ -175,12 +198,9 @@ class ProductFilters:
                 
                 else:
                     filters[key] = match.group(1)
-                
-                # Remover del query
-                query = re.sub(pattern, '', query, flags=re.IGNORECASE)
         
         # El resto es búsqueda de texto
-        remaining_text = query.strip()
+        remaining_text = ''.join(text_parts).strip()
         if remaining_text:
             filters['search_text'] = remaining_text
         
@@ -198,11 +218,21 @@ class ProductFilters:
         if name in self.saved_filters:
             return self.saved_filters[name]
         elif name in self.filter_presets:
-            return self.filter_presets[name]
+            # Copia: los predefinidos se comparten entre instancias
+            preset = self.filter_presets[name]
+            return replace(preset, selected_skus=list(preset.selected_skus))
         return None
     
     def get_filter_summary(self, criteria: FilterCriteria) -> str:
-        """Genera un resumen legible del filtro"""
+        """Genera un resumen legible del filtro (memoizado por valor)"""
+        key = _criteria_key(criteria)
+        if key is None:
+            return self._build_filter_summary(criteria)
+        return _cached_filter_summary(key)
+    
+    @staticmethod
+    def _build_filter_summary(criteria: FilterCriteria) -> str:
+        """Construye el resumen de get_filter_summary"""
         parts = []
         
         if criteria.familia:
@@ -264,3 +294,41 @@ class ProductFilters:
                 name: FilterCriteria(**f_dict) 
                 for name, f_dict in data['saved'].items()
             }
+
+
+_CRITERIA_FIELDS = tuple(f.name for f in fields(FilterCriteria))
+
+
+def _criteria_key(criteria: FilterCriteria) -> Optional[tuple]:
+    """
+    Tupla hashable (tipo, valor) por campo de criteria; None si algún valor no es hashable
+    El tipo evita que 1, 1.0 y True compartan entrada. selected_skus no interviene en
+    apply_filter ni en el resumen, así que se omite.
+    """
+    key = tuple(
+        (type(value), value)
+        for value in (getattr(criteria, name) for name in _CRITERIA_FIELDS if name != 'selected_skus')
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _criteria_from_key(key: tuple) -> FilterCriteria:
+    """FilterCriteria equivalente a la que generó key"""
+    names = (name for name in _CRITERIA_FIELDS if name != 'selected_skus')
+    return FilterCriteria(**{name: value for name, (_, value) in zip(names, key)})
+
+
+@lru_cache(maxsize=128)
+def _cached_filter_dict(key: tuple) -> Dict[str, Any]:
+    """apply_filter para una tupla de _criteria_key (el llamador copia el resultado)"""
+    return ProductFilters._build_filter_dict(_criteria_from_key(key))
+
+
+@lru_cache(maxsize=128)
+def _cached_filter_summary(key: tuple) -> str:
+    """get_filter_summary para una tupla de _criteria_key"""
+    return ProductFilters._build_filter_summary(_criteria_from_key(key))
@@ -9,19 +9,47 @@ from typing import Dict, List, Any, Optional, Callable
 import logging
 from datetime import datetime
 import json
+import re
 from pathlib import Path
 
 from .database_handler import DatabaseHandler
 from .product_filters import ProductFilters, FilterCriteria
 
+try:
+    import orjson
+except ImportError:  # Dependencia opcional: serialización JSON compilada
+    orjson = None
+
+try:
+    import pyarrow  # noqa: F401
+    _ARROW_STRINGS = True
+except ImportError:  # Dependencia opcional: sin pyarrow el texto queda en object
+    _ARROW_STRINGS = False
+
+# Primer número (con decimales con punto o coma) dentro de un texto, p.ej. "12,5 KVA"
+_NUMERIC_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+
 class ProductManager:
     """Gestor principal del módulo de productos"""
     
+    # Columnas que cubre la búsqueda simple en caché
+    SEARCH_COLUMNS = ('SKU', 'Descripción', 'Modelo')
+    # Columnas de texto que se guardan como cadenas Arrow (contiguas, kernels en C)
+    ARROW_STRING_COLUMNS = ('SKU', 'Descripción', 'Modelo', 'Familia', 'Marca')
+    
     def __init__(self):
         self.db_handler = DatabaseHandler()
         self.filters = ProductFilters()
         self.selected_products = set()
+        # Array de selected_products para isin; None si hay que reconstruirlo
+        self._selected_np = None
         self.product_cache = pd.DataFrame()
+        # Texto de búsqueda en minúsculas y el DataFrame del que se calculó
+        self._search_blob = None
+        self._search_blob_source = None
+        # Posiciones de fila por SKU y el DataFrame del que se calcularon
+        self._sku_rows = {}
+        self._sku_rows_source = None
         self.callbacks = {
             'on_selection_change': None,
             'on_filter_change': None,
@@ -47,7 +75,7 @@ class ProductManager:
             self.product_cache = pd.DataFrame()
             
             # Obtener datos desde la base de datos
-            if use_filter and self.filters.current_filter != FilterCriteria():
+            if use_filter and not self.filters.current_filter.is_default():
                 self.logger.info(f"refresh_products: Aplicando filtros: {self.filters.current_filter.__dict__}")
                 filter_dict = self.filters.apply_filter(self.filters.current_filter)
                 self.product_cache = self.db_handler.get_products_filtered(filter_dict)
@@ -116,34 +144,51 @@ class ProductManager:
         if df.empty:
             return df
         
+        # Texto en object a cadenas Arrow; las columnas category o ya Arrow no se tocan
+        if _ARROW_STRINGS:
+            for col in self.ARROW_STRING_COLUMNS:
+                if col in df.columns and df[col].dtype == object:
+                    df[col] = df[col].astype('string[pyarrow]')
+        
         # Agregar columnas calculadas
         if 'Potencia' in df.columns:
-            df['Potencia_Numerica'] = df['Potencia'].apply(self._extract_numeric_value)
+            df['Potencia_Numerica'] = self._extract_numeric_values(df['Potencia'])
         
         # Agregar columna de selección
-        df['selected'] = df['SKU'].isin(self.selected_products)
+        df['selected'] = df['SKU'].isin(self._selected_array())
         
         # Formatear precios
         if 'Precio_USD_con_IVA' in df.columns:
             # Asegurarse de que la columna sea numérica, convirtiendo errores a NaN
             df['Precio_USD_con_IVA'] = pd.to_numeric(df['Precio_USD_con_IVA'], errors='coerce')
             
-            df['Precio_Formateado'] = df['Precio_USD_con_IVA'].apply(
-                lambda x: f"${x:,.2f}" if pd.notna(x) else "N/A"
-            )
-        
-        # Reemplazar NaN por None para compatibilidad con JSON
-        return df.replace({np.nan: None})
+            # El formateador se aplica solo a los valores presentes; los nulos quedan "N/A"
+            df['Precio_Formateado'] = df['Precio_USD_con_IVA'].map(
+                '${:,.2f}'.format, na_action='ignore'
+            ).fillna("N/A")
+        
+        # Los NaN se conservan para no degradar columnas numéricas a object;
+        # la conversión a None se hace al serializar (ver to_records)
+        return df
     
-    def _extract_numeric_value(self, text: str) -> float:
-        """Extrae valor numérico de un texto"""
-        import re
-        if pd.isna(text):
-            return 0
-        match = re.search(r'(\d+(?:[.,]\d+)?)', str(text))
-        if match:
-            return float(match.group(1).replace(',', '.'))
-        return 0
+    @staticmethod
+    def to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """
+        Convierte el DataFrame a lista de diccionarios con None en lugar de NaN (JSON)
+        Solo se pasan a object las columnas que efectivamente tienen nulos.
+        """
+        null_cols = df.columns[df.isna().any().to_numpy()]
+        if len(null_cols):
+            df = df.astype({col: object for col in null_cols})
+            df[null_cols] = df[null_cols].where(df[null_cols].notna(), None)
+        return df.to_dict('records')
+    
+    @staticmethod
+    def _extract_numeric_values(texts: pd.Series) -> pd.Series:
+        """Extrae el valor numérico de cada texto (0 si es nulo o no contiene números)"""
+        numbers = texts.astype('string').str.extract(_NUMERIC_RE, expand=False)
+        numbers = numbers.str.replace(',', '.', regex=False)
+        return pd.to_numeric(numbers, errors='coerce').fillna(0).astype(float)
     
     def apply_filter(self, criteria: FilterCriteria) -> pd.DataFrame:
         """Aplica un filtro y actualiza los productos"""
@@ -163,14 +208,27 @@ class ProductManager:
             criteria = FilterCriteria(**advanced_filters)
             return self.apply_filter(criteria)
         else:
-            # Búsqueda simple en caché
-            query_lower = query.lower()
-            mask = (
-                self.product_cache['SKU'].str.lower().str.contains(query_lower, na=False) |
-                self.product_cache['Descripción'].str.lower().str.contains(query_lower, na=False) |
-                self.product_cache['Modelo'].str.lower().str.contains(query_lower, na=False)
-            )
-            return self.product_cache[mask]
+            # Búsqueda simple en caché: una sola búsqueda de subcadena (sin regex)
+            mask = self._get_search_blob().str.contains(query.lower(), regex=False, na=False)
+            return self.product_cache[mask.to_numpy(dtype=bool)]
+    
+    def _get_search_blob(self) -> pd.Series:
+        """
+        SKU, Descripción y Modelo en minúsculas unidos por un separador, uno por fila
+        Se recalcula solo cuando product_cache se reemplaza por otro DataFrame.
+        """
+        df = self.product_cache
+        if self._search_blob_source is not df:
+            parts = [
+                df[col].astype('string').fillna('').str.lower()
+                for col in self.SEARCH_COLUMNS if col in df.columns
+            ]
+            blob = parts[0] if parts else pd.Series('', index=df.index, dtype='string')
+            for part in parts[1:]:
+                blob = blob + '\x1f' + part
+            self._search_blob = blob
+            self._search_blob_source = df
+        return self._search_blob
     
     def select_product(self, sku: str, selected: bool = True):
         """Selecciona o deselecciona un producto"""
@@ -178,24 +236,39 @@ class ProductManager:
             self.selected_products.add(sku)
         else:
             self.selected_products.discard(sku)
+        self._selected_np = None
         
-        # Actualizar DataFrame
+        # Actualizar DataFrame (solo las filas del SKU, sin comparar toda la columna)
         if not self.product_cache.empty:
-            self.product_cache.loc[self.product_cache['SKU'] == sku, 'selected'] = selected
+            rows = self._get_sku_rows().get(sku)
+            if rows is not None:
+                self.product_cache.iloc[rows, self.product_cache.columns.get_loc('selected')] = selected
         
         # Callback
         if self.callbacks['on_selection_change']:
             self.callbacks['on_selection_change'](len(self.selected_products))
     
+    def _get_sku_rows(self) -> Dict[Any, np.ndarray]:
+        """
+        Posiciones de fila de cada SKU en product_cache
+        Se recalcula solo cuando product_cache se reemplaza por otro DataFrame.
+        """
+        df = self.product_cache
+        if self._sku_rows_source is not df:
+            self._sku_rows = df.groupby('SKU', sort=False, observed=True).indices
+            self._sku_rows_source = df
+        return self._sku_rows
+    
     def select_all(self, select: bool = True):
         """Selecciona o deselecciona todos los productos visibles"""
         if select:
-            visible_skus = self.product_cache['SKU'].tolist()
+            visible_skus = self.product_cache['SKU'].dropna().tolist()
             self.selected_products.update(visible_skus)
             self.product_cache['selected'] = True
         else:
             self.selected_products.clear()
             self.product_cache['selected'] = False
+        self._selected_np = None
         
         # Callback
         if self.callbacks['on_selection_change']:
@@ -203,24 +276,27 @@ class ProductManager:
     
     def select_by_criteria(self, criteria: Dict[str, Any]):
         """Selecciona productos según criterios específicos"""
-        mask = pd.Series([True] * len(self.product_cache))
+        df = self.product_cache
+        # Máscara numpy actualizada en el lugar; los nulos cuentan como no coincidentes
+        mask = np.ones(len(df), dtype=bool)
         
         if 'min_stock' in criteria:
-            mask &= self.product_cache['Stock'] >= criteria['min_stock']
+            mask &= (df['Stock'] >= criteria['min_stock']).to_numpy(dtype=bool, na_value=False)
         
         if 'max_price' in criteria:
-            mask &= self.product_cache['Precio_USD_con_IVA'] <= criteria['max_price']
+            mask &= (df['Precio_USD_con_IVA'] <= criteria['max_price']).to_numpy(dtype=bool, na_value=False)
         
         if 'familia' in criteria:
-            mask &= self.product_cache['Familia'] == criteria['familia']
+            mask &= (df['Familia'] == criteria['familia']).to_numpy(dtype=bool, na_value=False)
         
         if 'marca' in criteria:
-            mask &= self.product_cache['Marca'] == criteria['marca']
+            mask &= (df['Marca'] == criteria['marca']).to_numpy(dtype=bool, na_value=False)
         
         # Seleccionar productos que cumplan los criterios
-        matching_skus = self.product_cache[mask]['SKU'].tolist()
+        matching_skus = df.loc[mask, 'SKU'].dropna().tolist()
         self.selected_products.update(matching_skus)
-        self.product_cache.loc[mask, 'selected'] = True
+        self._selected_np = None
+        df.loc[mask, 'selected'] = True
         
         # Callback
         if self.callbacks['on_selection_change']:
@@ -231,7 +307,15 @@ class ProductManager:
         if not self.selected_products:
             return pd.DataFrame()
         
-        return self.product_cache[self.product_cache['SKU'].isin(self.selected_products)]
+        return self.product_cache[self.product_cache['SKU'].isin(self._selected_array())]
+    
+    def _selected_array(self) -> np.ndarray:
+        """selected_products como array (se construye una vez por cambio de selección)"""
+        if self._selected_np is None:
+            self._selected_np = np.fromiter(
+                self.selected_products, dtype=object, count=len(self.selected_products)
+            )
+        return self._selected_np
     
     def get_product_details(self, sku: str) -> Optional[Dict[str, Any]]:
         """Obtiene detalles completos de un producto"""
@@ -244,15 +328,16 @@ class ProductManager:
                 product = df
         
         if not product.empty:
-            return product.iloc[0].to_dict()
+            return self.to_records(product.iloc[:1])[0]
         
         return None
     
     def get_filter_options(self) -> Dict[str, List[str]]:
         """Obtiene opciones disponibles para filtros"""
+        distinct = self.db_handler.get_distinct_values_multi(['Familia', 'Marca'])
         return {
-            'familias': self.db_handler.get_distinct_values('Familia'),
-            'marcas': self.db_handler.get_distinct_values('Marca'),
+            'familias': distinct['Familia'],
+            'marcas': distinct['Marca'],
             'combustibles': ['diesel', 'nafta', 'gas'],
             'saved_filters': list(self.filters.saved_filters.keys()),
             'preset_filters': list(self.filters.filter_presets.keys())
@@ -272,8 +357,11 @@ class ProductManager:
                 'count': len(self.selected_products)
             }
             
-            with open(selection_file, 'w') as f:
-                json.dump(selection_data, f, indent=2)
+            if orjson is not None:
+                selection_file.write_bytes(orjson.dumps(selection_data, option=orjson.OPT_INDENT_2))
+            else:
+                with open(selection_file, 'w') as f:
+                    json.dump(selection_data, f, indent=2)
             
             self.logger.info(f"Selección guardada: {name}")
             return True
@@ -290,11 +378,13 @@ class ProductManager:
             if not selection_file.exists():
                 return False
             
-            with open(selection_file, 'r') as f:
-                selection_data = json.load(f)
+            # Se lee en bytes: orjson escribe UTF-8 sin escapar y json.loads lo detecta
+            raw = selection_file.read_bytes()
+            selection_data = orjson.loads(raw) if orjson is not None else json.loads(raw)
             
             # Restaurar selección
             self.selected_products = set(selection_data['products'])
+            self._selected_np = None
             
             # Restaurar filtro si existe
             if 'filter' in selection_data:
@@ -341,7 +431,8 @@ class ProductManager:
             selected_df = self.get_selected_products()
             if not selected_df.empty:
                 db_stats['selected_total_value'] = selected_df['Precio_USD_con_IVA'].sum()
-                db_stats['selected_total_stock'] = selected_df['Stock'].sum()
+                # Stock es VARCHAR ('5', 'Disponible', 'Consultar'): se suman solo los números
+                db_stats['selected_total_stock'] = int(pd.to_numeric(selected_df['Stock'], errors='coerce').sum())
         
         return db_stats
     
@@ -352,9 +443,10 @@ class ProductManager:
         if selected_df.empty:
             return []
         
-        # Convertir a formato esperado por otros módulos
+        # Convertir a formato esperado por otros módulos; to_dict('records') arma todas
+        # las filas de una vez (iterrows construía una Series por fila)
         products = []
-        for _, row in selected_df.iterrows():
+        for row in self.to_records(selected_df):
             product = {
                 'sku': row['SKU'],
                 'nombre': row['Descripción'],
@@ -365,7 +457,7 @@ class ProductManager:
                 'stock': row.get('Stock', 0),
                 'pdf_url': row.get('URL_PDF', ''),
                 # Agregar más campos según necesidad
-                'row_data': row.to_dict()  # Datos completos
+                'row_data': row  # Datos completos
             }
             products.append(product)
         
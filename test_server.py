@@ -4,41 +4,78 @@ import sys
 import os
 from pathlib import Path
 
+from flask import Flask, request
+
 # Agregar módulos al path
 sys.path.append(str(Path(__file__).parent))
 
-try:
+from version_manager import get_manager
+
+# Crear app simple
+app = Flask(__name__)
+
+# Cuerpo fijo de /health, serializado una sola vez
+_HEALTH_BODY = b'{"status":"ok"}'
+
+
+def _versioned_response(body, mimetype):
+    """Respuesta con ETag = versión actual; 304 si el cliente ya la tiene"""
+    response = app.response_class(body, mimetype=mimetype)
+    response.set_etag(get_manager().get_version_string())
+    return response.make_conditional(request)
+
+
+@app.route('/')
+def hello():
+    return _versioned_response("¡Servidor funcionando!", "text/html")
+
+
+@app.route('/health')
+def health():
+    return _versioned_response(_HEALTH_BODY, "application/json")
+
+
+def check_imports():
+    """Verifica que los módulos principales se importen (solo con --check-imports)"""
     print("Probando importaciones...")
-    
-    from flask import Flask
-    print("✓ Flask importado")
-    
-    from products.product_manager import ProductManager
+
+    from products.product_manager import ProductManager  # noqa: F401
     print("✓ ProductManager importado")
-    
-    from navigation.selenium_handler import SeleniumHandler
+
+    from navigation.selenium_handler import SeleniumHandler  # noqa: F401
     print("✓ SeleniumHandler importado")
-    
-    from ai_generator.ai_handler import AIHandler
+
+    from ai_generator.ai_handler import AIHandler  # noqa: F401
     print("✓ AIHandler importado")
-    
+
     print("Todas las importaciones exitosas!")
-    
-    # Crear app simple
-    app = Flask(__name__)
-    
-    @app.route('/')
-    def hello():
-        return "¡Servidor funcionando!"
-    
-    @app.route('/health')
-    def health():
-        return {"status": "ok"}
-    
-    print("Iniciando servidor en puerto 5001...")
-    app.run(debug=True, host='0.0.0.0', port=5001)
-    
-except Exception as e:
-    print(f"Error: {e}")
-    import traceback
-    traceback.print_exc()
+
+
+def main():
+    if "--check-imports" in sys.argv:
+        check_imports()
+
+    if "--dev" in sys.argv:
+        # Servidor de desarrollo con debugger y recarga (no sirve para medir rendimiento)
+        print("Iniciando servidor de desarrollo en puerto 5001...")
+        app.run(debug=True, host='0.0.0.0', port=5001)
+    else:
+        try:
+            from waitress import serve
+        except ImportError:  # Dependencia opcional: sin waitress, servidor de Flask sin debug
+            serve = None
+
+        print("Iniciando servidor en puerto 5001...")
+        if serve is not None:
+            serve(app, host='0.0.0.0', port=5001, threads=os.cpu_count() or 4)
+        else:
+            app.run(host='0.0.0.0', port=5001, threaded=True)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
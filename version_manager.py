@@ -3,41 +3,132 @@ Sistema de versionado para evitar problemas de cache
 """
 
 import json
+import os
+import threading
 import time
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # Dependencia opcional: serialización JSON compilada
+    orjson = None
+
+
+@lru_cache(maxsize=8)
+def _read_version_file(path: str, mtime_ns: int) -> dict:
+    """Lee y parsea version.json; el mtime en la clave invalida la caché si el archivo cambia"""
+    # os.open + una sola lectura del tamaño del archivo (sin capa de buffer ni de texto)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        raw = os.read(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
 
 class VersionManager:
     def __init__(self):
         self.version_file = Path("version.json")
+        # get_version_string en caché; None cuando cambia self.data
+        self._version_string = None
+        # mtime de version.json la última vez que se leyó o escribió
+        self._mtime_ns = None
+        # Serializa lecturas y escrituras entre hilos del servidor
+        self._lock = threading.RLock()
         self.load_version()
 
     def load_version(self):
         """Carga o crea el archivo de versión"""
-        if self.version_file.exists():
-            with open(self.version_file, "r") as f:
-                self.data = json.load(f)
-        else:
-            self.data = {
-                "version": "1.0.0",
-                "build": int(time.time()),
-                "last_update": datetime.now().isoformat(),
-            }
-            self.save_version()
+        with self._lock:
+            try:
+                st = self.version_file.stat()
+            except FileNotFoundError:
+                st = None
+
+            if st is not None:
+                # Copia: bump_build modifica self.data y no debe alterar la caché
+                self.data = dict(_read_version_file(str(self.version_file), st.st_mtime_ns))
+                self._mtime_ns = st.st_mtime_ns
+            else:
+                self.data = {
+                    "version": "1.0.0",
+                    "build": int(time.time()),
+                    "last_update": datetime.now().isoformat(),
+                }
+                self.save_version()
+            self._version_string = None
 
     def save_version(self):
         """Guarda el archivo de versión"""
-        with open(self.version_file, "w") as f:
-            json.dump(self.data, f, indent=2)
+        with self._lock:
+            # JSON compacto: el archivo lo lee el programa, no una persona
+            if orjson is not None:
+                payload = orjson.dumps(self.data)
+            else:
+                payload = json.dumps(self.data, separators=(",", ":")).encode()
+
+            # Escritura en un temporal y reemplazo atómico: otro proceso nunca lee un archivo a medias
+            tmp_file = self.version_file.with_name(f"{self.version_file.name}.{os.getpid()}.tmp")
+            tmp_file.write_bytes(payload)
+            os.replace(tmp_file, self.version_file)
+            self._mtime_ns = self.version_file.stat().st_mtime_ns
+            # El mtime puede no cambiar entre dos escrituras rápidas: se descarta la caché
+            _read_version_file.cache_clear()
+
+    def _maybe_reload(self):
+        """Vuelve a cargar version.json solo si otro proceso lo modificó"""
+        try:
+            mtime_ns = self.version_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns != self._mtime_ns:
+            with self._lock:
+                # Otro hilo pudo recargarlo mientras se esperaba el lock
+                if mtime_ns != self._mtime_ns:
+                    self.load_version()
 
     def bump_build(self):
         """Incrementa el número de build"""
-        self.data["build"] = int(time.time())
-        self.data["last_update"] = datetime.now().isoformat()
-        self.save_version()
-        return self.data["build"]
+        with self._lock:
+            self._maybe_reload()
+            # Build y fecha salen de una misma lectura del reloj
+            now = time.time()
+            build = int(now)
+            if build == self.data.get("build"):
+                # Mismo segundo: el build no cambia, no hace falta reescribir el archivo
+                return build
+            self.data["build"] = build
+            self.data["last_update"] = datetime.fromtimestamp(now).isoformat()
+            self.save_version()
+            self._version_string = None
+            return self.data["build"]
 
     def get_version_string(self):
         """Retorna string de versión para URLs"""
-        return f"v{self.data['version']}-{self.data['build']}"
+        self._maybe_reload()
+        version_string = self._version_string
+        if version_string is None:
+            # Bajo el lock: bump_build/load_version no pueden limpiar la caché entre
+            # leer self.data y guardar el resultado (quedaría fija una versión vieja)
+            with self._lock:
+                if self._version_string is None:
+                    self._version_string = f"v{self.data['version']}-{self.data['build']}"
+                version_string = self._version_string
+        return version_string
+
+
+# Instancia compartida del proceso (ver get_manager)
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """Retorna el VersionManager compartido; usar en lugar de crear uno por llamada"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = VersionManager()
+    return _manager